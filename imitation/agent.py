@@ -1,91 +1,34 @@
 import os
-import numpy as np
-import torch
 from lux.game import Game
+from lux.game_constants import GAME_CONSTANTS
+from encoder import ObservationEncoder
+from decoder import get_actions
+from turn_timer import TurnTimer
+from backends import start_model
 
 path = '/kaggle_simulations/agent' if os.path.exists('/kaggle_simulations') else '.'
-model = torch.jit.load(f'{path}/model.pth')
-model.eval()
+# LUX_MODEL picks the exported model file, LUX_MODEL_BACKEND overrides the runtime its extension implies.
+# The model loads and warms up in the background on LUX_THREADS threads (0 keeps the runtime's default),
+# LUX_MODEL_STARTUP=eager or lazy changes when.
+model = start_model(
+  os.path.join(path, os.environ.get('LUX_MODEL', 'model.pth')),
+  backend=os.environ.get('LUX_MODEL_BACKEND'),
+  threads=int(os.environ.get('LUX_THREADS', 1)),
+  startup=os.environ.get('LUX_MODEL_STARTUP', 'background')
+)
 
-def make_input(obs, unit_id):
-  width, height = obs.width, obs.height
-  x_shift = (32 - width) // 2
-  y_shift = (32 - height) // 2
-  cities = {}
-  
-  b = np.zeros((20, 32, 32), dtype=np.float32)
-  
-  for update in obs['updates']:
-    strs = update.split(' ')
-    input_identifier = strs[0]
-    
-    if input_identifier == 'u':
-      x = int(strs[4]) + x_shift
-      y = int(strs[5]) + y_shift
-      wood = int(strs[7])
-      coal = int(strs[8])
-      uranium = int(strs[9])
-      if unit_id == strs[3]:
-        # Position and Cargo
-        b[:2, x, y] = (
-          1,
-          (wood + coal + uranium) / 100
-        )
-      else:
-        # Units
-        team = int(strs[2])
-        cooldown = float(strs[6])
-        idx = 2 + (team - obs['player']) % 2 * 3
-        b[idx:idx + 3, x, y] = (
-          1,
-          cooldown / 6,
-          (wood + coal + uranium) / 100
-        )
-    elif input_identifier == 'ct':
-      # CityTiles
-      team = int(strs[1])
-      city_id = strs[2]
-      x = int(strs[3]) + x_shift
-      y = int(strs[4]) + y_shift
-      idx = 8 + (team - obs['player']) % 2 * 2
-      b[idx:idx + 2, x, y] = (
-        1,
-        cities[city_id]
-      )
-    elif input_identifier == 'r':
-      # Resources
-      r_type = strs[1]
-      x = int(strs[2]) + x_shift
-      y = int(strs[3]) + y_shift
-      amt = int(float(strs[4]))
-      b[{'wood': 12, 'coal': 13, 'uranium': 14}[r_type], x, y] = amt / 800
-    elif input_identifier == 'rp':
-      # Research Points
-      team = int(strs[1])
-      rp = int(strs[2])
-      b[15 + (team - obs['player']) % 2, :] = min(rp, 200) / 200
-    elif input_identifier == 'c':
-      # Cities
-      city_id = strs[2]
-      fuel = float(strs[3])
-      lightupkeep = float(strs[4])
-      cities[city_id] = min(fuel / lightupkeep, 10) / 10
-  
-  # Day/Night Cycle
-  b[17, :] = obs['step'] % 40 / 40
-  # Turns
-  b[18, :] = obs['step'] / 360
-  # Map Size
-  b[19, x_shift:32 - x_shift, y_shift:32 - y_shift] = 1
+# Set LUX_TURN_TIMINGS=timings.json (or .csv) to record where turn time goes
+timer = TurnTimer(os.environ.get('LUX_TURN_TIMINGS'))
 
-  return b
+def make_input(obs, unit_id):
+  return ObservationEncoder(obs, obs['player']).make_input(unit_id)
 
 game_state = None
 def get_game_state(observation):
   global game_state
   
   if observation["step"] == 0:
-    game_state = Game()
+    game_state = Game(incremental=True)
     game_state._initialize(observation["updates"])
     game_state._update(observation["updates"][2:])
     game_state.id = observation.player
@@ -94,33 +37,27 @@ def get_game_state(observation):
   return game_state
 
 
-def in_city(pos):  
-  try:
-    city = game_state.map.get_cell_by_pos(pos).citytile
-    return city is not None and city.team == game_state.id
-  except:
+def in_city(pos):
+  if not (0 <= pos.x < game_state.map_width and 0 <= pos.y < game_state.map_height):
     return False
+  city = game_state.map.get_cell_by_pos(pos).citytile
+  return city is not None and city.team == game_state.id
 
 
-def call_func(obj, method, args=[]):
-  return getattr(obj, method)(*args)
-
-
-unit_actions = [('move', 'n'), ('move', 's'), ('move', 'w'), ('move', 'e'), ('build_city',)]
-def get_action(policy, unit, dest):
-  for label in np.argsort(policy)[::-1]:
-    act = unit_actions[label]
-    pos = unit.pos.translate(act[-1], 1) or unit.pos
-    if pos not in dest or in_city(pos):
-      return call_func(unit, *act), pos 
-      
-  return unit.move('c'), unit.pos
+def agent(observation, configuration):
+  with timer.turn(observation['step']):
+    actions = take_turn(observation)
+  # Runners kill the agent once the match is over, often before atexit handlers run
+  if observation['step'] >= GAME_CONSTANTS['PARAMETERS']['MAX_DAYS'] - 1:
+    timer.dump()
+  return actions
 
 
-def agent(observation, configuration):
+def take_turn(observation):
   global game_state
   
-  game_state = get_game_state(observation)  
+  with timer.phase('parse'):
+    game_state = get_game_state(observation)
   player = game_state.players[observation.player]
   actions = []
   
@@ -137,17 +74,24 @@ def agent(observation, configuration):
           player.research_points += 1
   
   # Worker Actions
-  dest = []
-  for unit in player.units:
-    if unit.can_act() and (game_state.turn % 40 < 30 or not in_city(unit.pos)) and hasattr(observation, 'width'):
-      state = make_input(observation, unit.id)
-      with torch.no_grad():
-        p = model(torch.from_numpy(state).unsqueeze(0))
-
-      policy = p.squeeze(0).numpy()
+  units = [
+    unit for unit in player.units
+    if unit.can_act() and (game_state.turn % 40 < 30 or not in_city(unit.pos)) and hasattr(observation, 'width')
+  ]
+  if not units:
+    return actions
 
-      action, pos = get_action(policy, unit, dest)
-      actions.append(action)
-      dest.append(pos)
+  # One forward pass for every unit that can act this turn, on the map cropped
+  # to its size when the model was exported for it
+  with timer.phase('model_wait'):
+    # Blocks until a lazy or background model has loaded
+    crop_border = model.crop_border
+  with timer.phase('encode'):
+    encoder = ObservationEncoder(observation, observation.player)
+    states = encoder.make_inputs([unit.id for unit in units], crop_border)
+  with timer.phase('inference'):
+    policies = model(states)
 
+  with timer.phase('decode'):
+    actions += get_actions(policies, units, game_state.map, game_state.id)
   return actions
\ No newline at end of file
@@ -0,0 +1,61 @@
+import torch
+from torch.utils.data import default_collate
+
+# Labels are north, south, west, east, bcity; moves as (dx, dy) on the x, y axes of the planes
+MOVES = [(0, -1), (0, 1), (-1, 0), (1, 0)]
+
+
+def transform(states, k):
+  """
+  The k-th of the 8 symmetries of the square, applied to the last two (x, y)
+  dims: k % 4 quarter turns, after a flip of y when k >= 4. Maps are square and
+  centered on the 32x32 canvas, or cropped evenly around it, so the map mask in
+  channel 19 and the padding around it map onto themselves.
+  """
+  if k >= 4:
+    states = states.flip(-1)
+  return torch.rot90(states, k % 4, dims=(-2, -1))
+
+
+def _label_maps():
+  """
+  (8, 5) table of where each label goes under each symmetry, found by moving
+  a marker with transform itself so the two can't disagree
+  """
+  maps = torch.arange(5).repeat(8, 1)
+  for k in range(8):
+    for label, (dx, dy) in enumerate(MOVES):
+      marker = torch.zeros(3, 3)
+      marker[1 + dx, 1 + dy] = 1
+      x, y = (transform(marker, k) == 1).nonzero()[0].tolist()
+      maps[k, label] = MOVES.index((x - 1, y - 1))
+  return maps
+
+LABEL_MAPS = _label_maps()
+
+
+def augment_batch(states, actions):
+  """
+  Applies an independent random symmetry to every sample of a batch, with its
+  action relabelled to match. Samples are transformed in one call per symmetry.
+  """
+  ks = torch.randint(8, (len(states),))
+  out = torch.empty_like(states)
+  for k in range(8):
+    rows = (ks == k).nonzero().squeeze(1)
+    if len(rows):
+      out[rows] = transform(states[rows], k)
+  return out, LABEL_MAPS[ks, actions]
+
+
+class AugmentCollate:
+  """
+  DataLoader collate_fn that batches samples with collate, then augments the
+  batch with augment_batch. Samples stay in their original orientation on disk.
+  """
+  def __init__(self, collate=default_collate):
+    self.collate = collate
+
+  def __call__(self, batch):
+    states, actions = self.collate(batch)
+    return augment_batch(states, actions)
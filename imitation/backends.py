@@ -0,0 +1,134 @@
+import threading
+import numpy as np
+
+BACKENDS = ['torchscript', 'onnx', 'numpy']
+STARTUPS = ['eager', 'lazy', 'background']
+
+
+def backend_for(path):
+  if path.endswith('.onnx'):
+    return 'onnx'
+  if path.endswith('.npz'):
+    return 'numpy'
+  return 'torchscript'
+
+
+def load_model(path, backend=None, threads=None, warmup=True):
+  """
+  Loads a policy model and returns predict(states) -> policies, both NumPy
+  arrays of shape (units, 20, height, width) and (units, 5). predict.crop_border
+  is the border the model was trained with on maps cropped to their size (see
+  encoder.crop_window), None for models that take the whole 32x32 canvas.
+
+  torchscript covers every TorchScript export (fp32, int8, frozen); onnx runs
+  on ONNX Runtime and needs it installed; numpy runs the .npz weights without
+  importing torch at all. By default the backend follows the file extension.
+
+  threads caps the intra- and inter-op thread pools of torch and ONNX Runtime
+  (None keeps their defaults). warmup runs dummy inputs through the model so
+  JIT profiling and allocator warm-up don't land in the first turn.
+  """
+  predict, crop_border = _load(path, backend or backend_for(path), threads)
+  predict.crop_border = crop_border
+  if warmup:
+    dummy = np.zeros((1, 20, 32, 32), dtype=np.float32)
+    # The TorchScript profiling executor optimizes the graph on its second run
+    for _ in range(2):
+      predict(dummy)
+  return predict
+
+
+def _load(path, backend, threads):
+
+  if backend == 'torchscript':
+    import torch
+    if threads:
+      try:
+        torch.set_num_interop_threads(threads)
+      except RuntimeError:
+        # Only allowed once, before any inter-op work has started
+        pass
+    extra_files = {'format': '', 'crop_border': ''}
+    model = torch.jit.load(path, _extra_files=extra_files)
+    model.eval()
+    if extra_files['format'] == b'frozen':
+      model = torch.jit.optimize_for_inference(model)
+
+    def predict(states):
+      # The intra-op pool size is per thread with OpenMP, so it is set on the
+      # thread that predicts, not the one a background startup loaded on
+      if threads and torch.get_num_threads() != threads:
+        torch.set_num_threads(threads)
+      with torch.no_grad():
+        return model(torch.from_numpy(states)).numpy()
+    return predict, int(extra_files['crop_border']) if extra_files['crop_border'] else None
+
+  if backend == 'onnx':
+    import onnxruntime
+    options = onnxruntime.SessionOptions()
+    if threads:
+      options.intra_op_num_threads = threads
+      options.inter_op_num_threads = threads
+    session = onnxruntime.InferenceSession(path, options, providers=['CPUExecutionProvider'])
+    input_name = session.get_inputs()[0].name
+    crop_border = session.get_modelmeta().custom_metadata_map.get('crop_border')
+
+    def predict(states):
+      return session.run(None, {input_name: states})[0]
+    return predict, None if crop_border is None else int(crop_border)
+
+  if backend == 'numpy':
+    from numpy_net import NumpyLuxNet
+    model = NumpyLuxNet(path)
+    return model, model.crop_border
+
+  raise ValueError(f'Unknown backend {backend}, expected one of {BACKENDS}')
+
+
+class LazyModel:
+  """
+  A model that is loaded on its first prediction, or by a background thread
+  that the first prediction waits for
+  """
+  def __init__(self, load, background=False):
+    self._load = load
+    self._predict = None
+    self._thread = None
+    if background:
+      self._thread = threading.Thread(target=self._run_load, daemon=True)
+      self._thread.start()
+
+  def _run_load(self):
+    self._predict = self._load()
+
+  def _loaded(self):
+    if self._predict is None:
+      if self._thread is not None:
+        self._thread.join()
+        self._thread = None
+      if self._predict is None:
+        # Lazy startup, or the background load failed and should raise here
+        self._predict = self._load()
+    return self._predict
+
+  @property
+  def crop_border(self):
+    return self._loaded().crop_border
+
+  def __call__(self, states):
+    return self._loaded()(states)
+
+
+def start_model(path, backend=None, threads=None, startup='eager'):
+  """
+  load_model with a startup mode: eager loads now, lazy on the first
+  prediction, background in a thread started now
+  """
+  def load():
+    return load_model(path, backend, threads)
+
+  if startup == 'eager':
+    return load()
+  if startup in ('lazy', 'background'):
+    return LazyModel(load, background=startup == 'background')
+  raise ValueError(f'Unknown startup {startup}, expected one of {STARTUPS}')
@@ -0,0 +1,147 @@
+import numpy as np
+import torch
+from torch.utils.data import Sampler, default_collate
+import distributed
+from encoder import crop_window
+
+
+def split_batches(order, batch_size, drop_last=False, sizes=None, shuffle=False):
+  """
+  Cuts the sample indices in order into batches. With sizes, each sample's map
+  size, no batch mixes sizes: every size is cut separately, keeping order
+  within it, and with shuffle the batches of all sizes are interleaved at
+  random.
+  """
+  buckets = [order] if sizes is None else [order[sizes[order] == size] for size in np.unique(sizes)]
+  batches = []
+  for bucket in buckets:
+    count = len(bucket) // batch_size if drop_last else (len(bucket) + batch_size - 1) // batch_size
+    batches += [bucket[i * batch_size:(i + 1) * batch_size] for i in range(count)]
+  if shuffle and sizes is not None:
+    batches = [batches[i] for i in torch.randperm(len(batches)).tolist()]
+  return batches
+
+
+def count_batches(n, batch_size, drop_last=False, sizes=None):
+  counts = [n] if sizes is None else np.unique(sizes, return_counts=True)[1]
+  if drop_last:
+    return sum(int(count) // batch_size for count in counts)
+  return sum((int(count) + batch_size - 1) // batch_size for count in counts)
+
+
+class ObservationBatchSampler(Sampler):
+  """
+  Batches of sample indices with the samples of each observation kept
+  together, so a batch spans few observations. obs holds each sample's
+  observation. With shuffle, observations come in a random order and their
+  samples in a random order within them. With sizes, batches don't mix map
+  sizes. In a process group every process draws the same order and takes
+  every world_size-th batch of it.
+  """
+  def __init__(self, obs, batch_size, shuffle=True, drop_last=False, sizes=None):
+    self.obs = np.asarray(obs)
+    self.batch_size = batch_size
+    self.shuffle = shuffle
+    self.drop_last = drop_last
+    self.sizes = None if sizes is None else np.asarray(sizes)
+    self.rank, self.world_size = distributed.rank(), distributed.world_size()
+
+  def __len__(self):
+    batches = count_batches(len(self.obs), self.batch_size, self.drop_last, self.sizes)
+    return len(range(self.rank, batches, self.world_size))
+
+  def __iter__(self):
+    if self.shuffle:
+      rank = torch.randperm(int(self.obs.max()) + 1).numpy()[self.obs]
+      order = np.lexsort((torch.rand(len(self.obs)).numpy(), rank))
+    else:
+      order = np.argsort(self.obs, kind='stable')
+    batches = split_batches(order, self.batch_size, self.drop_last, self.sizes, self.shuffle)
+    for batch in batches[self.rank::self.world_size]:
+      yield batch.tolist()
+
+
+class MapSizeBatchSampler(Sampler):
+  """
+  Batches of sample indices of a single map size each, sizes holding every
+  sample's, so they can be cropped to the map. With shuffle, samples and
+  batches come in a random order. Shared out in a process group like
+  ObservationBatchSampler.
+  """
+  def __init__(self, sizes, batch_size, shuffle=True, drop_last=False):
+    self.sizes = np.asarray(sizes)
+    self.batch_size = batch_size
+    self.shuffle = shuffle
+    self.drop_last = drop_last
+    self.rank, self.world_size = distributed.rank(), distributed.world_size()
+
+  def __len__(self):
+    batches = count_batches(len(self.sizes), self.batch_size, self.drop_last, self.sizes)
+    return len(range(self.rank, batches, self.world_size))
+
+  def __iter__(self):
+    order = torch.randperm(len(self.sizes)).numpy() if self.shuffle else np.arange(len(self.sizes))
+    batches = split_batches(order, self.batch_size, self.drop_last, self.sizes, self.shuffle)
+    for batch in batches[self.rank::self.world_size]:
+      yield batch.tolist()
+
+
+class ShardSampler(Sampler):
+  """
+  This process's share of range(n) in a process group: a random permutation,
+  drawn from torch's RNG and so the same in every equally seeded process, or
+  range(n) itself without shuffle, dealt round-robin
+  """
+  def __init__(self, n, shuffle=True):
+    self.n = n
+    self.shuffle = shuffle
+    self.rank, self.world_size = distributed.rank(), distributed.world_size()
+
+  def __len__(self):
+    return len(range(self.rank, self.n, self.world_size))
+
+  def __iter__(self):
+    order = torch.randperm(self.n) if self.shuffle else torch.arange(self.n)
+    return iter(order[self.rank::self.world_size].tolist())
+
+
+class ObservationCollate:
+  """
+  collate_fn turning a batch of sample indices into (states, actions) tensors
+  with LuxDataset.encode_batch. Use it on a DataLoader over
+  range(len(dataset)), so the indices are what reaches it.
+  """
+  def __init__(self, dataset):
+    self.dataset = dataset
+
+  def __call__(self, indices):
+    states, actions = self.dataset.encode_batch(indices)
+    return torch.from_numpy(states), torch.from_numpy(actions)
+
+
+def crop_to_map(states, border):
+  """
+  Crops a batch of inputs for one map size, centered on the 32x32 canvas, to
+  the map plus border cells on every side, as far as the canvas reaches. The
+  map size comes from the map mask in channel 19.
+  """
+  width = states[:, 19, :, 16].sum(1)
+  height = states[:, 19, 16, :].sum(1)
+  if (width != width[0]).any() or (height != height[0]).any():
+    raise ValueError('crop_to_map needs a batch of one map size, see MapSizeBatchSampler')
+  xs, ys = crop_window(int(width[0]), int(height[0]), border)
+  return states[:, :, xs, ys]
+
+
+class CropCollate:
+  """
+  collate_fn that batches samples with collate, then crops the states with
+  crop_to_map
+  """
+  def __init__(self, border, collate=default_collate):
+    self.border = border
+    self.collate = collate
+
+  def __call__(self, batch):
+    states, actions = self.collate(batch)
+    return crop_to_map(states, self.border).contiguous(), actions
@@ -0,0 +1,76 @@
+import argparse
+import os
+import tempfile
+import time
+import numpy as np
+from backends import load_model
+from export import FORMATS, export, load_luxnet, replay_inputs
+
+
+def benchmark(predict, batches, repeats):
+  """
+  Per-turn latencies in ms and the policies of the last repeat
+  """
+  latencies = []
+  for _ in range(repeats):
+    policies = []
+    for batch in batches:
+      start = time.perf_counter()
+      policies.append(predict(batch))
+      latencies.append((time.perf_counter() - start) * 1000)
+  return np.array(latencies), policies
+
+
+def run(model_path, replay_path, formats, repeats, crop_border=None, calibration_path=None):
+  batches = replay_inputs(replay_path, border=crop_border)
+  turns = slice(None)
+  if calibration_path is not None:
+    calibration = replay_inputs(calibration_path, 200, crop_border)
+  else:
+    # int8-static mustn't be scored on the turns it was calibrated on, so the
+    # even turns calibrate and the odd ones are timed and scored
+    calibration, turns = batches[::2][:200], slice(1, None, 2)
+    batches = batches[turns]
+  model = load_luxnet(model_path)
+
+  with tempfile.TemporaryDirectory() as tmp:
+    reference = None
+    if crop_border is not None:
+      # Agreement is against fp32 on the whole 32x32 canvas
+      predict = load_model(model_path)
+      reference = np.concatenate([predict(batch).argmax(1) for batch in replay_inputs(replay_path)[turns]])
+      print(f'inputs cropped to the map plus {crop_border} cells per side')
+    print(f'{len(batches)} turns, {sum(len(b) for b in batches)} unit inputs from {replay_path}')
+    print(f'{"format":<14}{"p50 ms":>10}{"p95 ms":>10}{"max ms":>10}{"agreement":>12}')
+    for fmt in formats:
+      path = os.path.join(tmp, f'model-{fmt}.' + {'onnx': 'onnx', 'npz': 'npz'}.get(fmt, 'pth'))
+      try:
+        export(model, fmt, path, calibration=calibration, crop_border=crop_border)
+        predict = load_model(path)
+      except ImportError as e:
+        print(f'{fmt:<14}skipped: {e}')
+        continue
+
+      predict(batches[0])
+      latencies, policies = benchmark(predict, batches, repeats)
+      labels = np.concatenate([p.argmax(1) for p in policies])
+      if reference is None:
+        reference = labels
+      agreement = (labels == reference).mean()
+      p50, p95 = np.percentile(latencies, [50, 95])
+      print(f'{fmt:<14}{p50:>10.2f}{p95:>10.2f}{latencies.max():>10.2f}{agreement:>12.4f}')
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='Latency and action agreement of exported LuxNet backends against fp32')
+  parser.add_argument('--model', default='model.pth')
+  parser.add_argument('--replay', default='replay.json', help='recorded episode whose observations are replayed')
+  parser.add_argument('--formats', nargs='+', default=FORMATS, choices=FORMATS)
+  parser.add_argument('--calibration', help='replay that calibrates int8-static, by default the even turns of --replay, leaving the odd ones to score')
+  parser.add_argument('--repeats', type=int, default=3)
+  parser.add_argument('--crop-border', type=int, help='feed maps cropped to their size plus this border instead of the 32x32 canvas')
+  args = parser.parse_args()
+
+  # fp32 goes first, it is the reference the others are scored against
+  args.formats = ['fp32'] + [fmt for fmt in args.formats if fmt != 'fp32']
+  run(args.model, args.replay, args.formats, args.repeats, args.crop_border, args.calibration)
@@ -0,0 +1,74 @@
+import argparse
+import json
+import os
+import tempfile
+import time
+import torch
+import torch.distributed as dist
+from torch import nn
+import distributed
+from benchmark_training import load_batches
+from train import LuxNet, prepare_model, to_device
+
+
+def measure(rank, world_size, batches, steps, threads, out):
+  """
+  Times steps data-parallel training steps per process; rank 0 writes the
+  overall samples/sec to out
+  """
+  torch.set_num_threads(threads or max(1, os.cpu_count() // world_size))
+  torch.manual_seed(42)
+  model = LuxNet()
+  forward = prepare_model(model, torch.device('cpu'))
+  model.train()
+  optimizer = torch.optim.AdamW(model.parameters(), lr=1e-3)
+  criterion = nn.CrossEntropyLoss()
+
+  def step(item):
+    states, actions = to_device(item, torch.device('cpu'))
+    optimizer.zero_grad()
+    criterion(forward(states), actions).backward()
+    optimizer.step()
+    return len(actions)
+
+  # Each process trains on its own batches, as with a sharded dataset
+  batches = batches[rank::world_size] or batches
+  for item in batches[:2]:
+    step(item)
+  if dist.is_initialized():
+    dist.barrier()
+  start = time.perf_counter()
+  samples = sum(step(batches[i % len(batches)]) for i in range(steps))
+  if dist.is_initialized():
+    dist.barrier()
+  seconds = time.perf_counter() - start
+  samples = distributed.all_reduce_sum([samples])[0]
+  if rank == 0:
+    with open(out, 'w') as f:
+      json.dump({'samples_per_sec': samples / seconds, 'threads': torch.get_num_threads()}, f)
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='Scaling of data-parallel CPU training over local gloo processes')
+  parser.add_argument('--replay', default='replay.json', help='recorded episode the inputs come from')
+  parser.add_argument('--processes', nargs='+', type=int, default=[1, 2, 4, 8])
+  parser.add_argument('--threads', type=int, help='threads per process, cores / processes by default')
+  parser.add_argument('--batch-size', type=int, default=64, help='per process')
+  parser.add_argument('--steps', type=int, default=30, help='per process')
+  args = parser.parse_args()
+
+  batches = load_batches(args.replay, args.batch_size, 16)
+  print(f'{os.cpu_count()} cores, batch size {args.batch_size} per process, {args.steps} steps')
+  # Speedup and efficiency are relative to the first process count
+  print(f'{"processes":>10}{"threads":>9}{"samples/s":>11}{"speedup":>9}{"efficiency":>12}')
+  base = None
+  with tempfile.TemporaryDirectory() as tmp:
+    for n in args.processes:
+      out = os.path.join(tmp, f'{n}.json')
+      distributed.launch(measure, n, batches, args.steps, args.threads, out)
+      with open(out) as f:
+        result = json.load(f)
+      rate = result['samples_per_sec']
+      base = base or (n, rate)
+      speedup = rate / base[1]
+      print(f'{n:>10}{result["threads"]:>9}{rate:>11.1f}{speedup:>9.2f}{speedup * base[0] / n:>12.2f}')
@@ -0,0 +1,71 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import numpy as np
+
+# Runs in a fresh interpreter so every sample pays the full cold start
+CHILD = '''
+import json, resource, sys, time
+# The replay is read up front, it isn't part of the agent's startup
+with open(sys.argv[1]) as f:
+  steps = json.load(f)['steps']
+start = time.perf_counter()
+import agent
+imported = time.perf_counter()
+
+class Observation(dict):
+  def __getattr__(self, name):
+    try:
+      return self[name]
+    except KeyError:
+      raise AttributeError(name)
+
+latencies = []
+for i in range(2):
+  obs = Observation(steps[i][0]['observation'], player=0)
+  turn = time.perf_counter()
+  agent.agent(obs, None)
+  latencies.append(time.perf_counter() - turn)
+
+print(json.dumps({
+  'import': imported - start,
+  'first_action': time.perf_counter() - start - latencies[1],
+  'turn0': latencies[0],
+  'turn1': latencies[1],
+  'rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+}))
+'''
+
+
+def measure(env, replay, repeats):
+  samples = []
+  for _ in range(repeats):
+    out = subprocess.run(
+      [sys.executable, '-c', CHILD, replay],
+      env={**os.environ, **env}, capture_output=True, text=True, check=True
+    ).stdout
+    samples.append(json.loads(out.strip().splitlines()[-1]))
+  return {key: np.median([s[key] for s in samples]) for key in samples[0]}
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='Import-to-first-action latency of the imitation agent')
+  parser.add_argument('--models', nargs='+', default=['model.pth', 'model.npz'])
+  parser.add_argument('--startups', nargs='+', default=['eager', 'lazy', 'background'])
+  parser.add_argument('--threads', nargs='+', default=['1', '0'], help='LUX_THREADS values, 0 keeps the runtime default')
+  parser.add_argument('--replay', default='replay.json')
+  parser.add_argument('--repeats', type=int, default=3)
+  args = parser.parse_args()
+
+  print(f'{"model":<12}{"startup":<12}{"threads":>8}{"import s":>10}{"1st action s":>14}{"turn0 ms":>10}{"turn1 ms":>10}{"rss MB":>8}')
+  for model in args.models:
+    for startup in args.startups:
+      for threads in args.threads:
+        env = {'LUX_MODEL': model, 'LUX_MODEL_STARTUP': startup, 'LUX_THREADS': threads}
+        r = measure(env, args.replay, args.repeats)
+        print(
+          f'{model:<12}{startup:<12}{threads:>8}{r["import"]:>10.3f}{r["first_action"]:>14.3f}'
+          f'{r["turn0"] * 1000:>10.1f}{r["turn1"] * 1000:>10.1f}{r["rss_mb"]:>8.0f}'
+        )
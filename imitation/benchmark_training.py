@@ -0,0 +1,75 @@
+import argparse
+import itertools
+import time
+import numpy as np
+import torch
+from torch import nn
+from export import replay_inputs
+from train import LuxNet, get_device, prepare_model, to_device
+
+
+def benchmark(batches, device, channels_last, bf16, compile, steps):
+  """
+  Training samples/sec of a fresh LuxNet over batches, after a few untimed
+  warm-up steps (which also absorb torch.compile's compilation)
+  """
+  torch.manual_seed(42)
+  model = LuxNet()
+  forward = prepare_model(model, device, channels_last, compile)
+  model.train()
+  optimizer = torch.optim.AdamW(model.parameters(), lr=1e-3)
+  criterion = nn.CrossEntropyLoss()
+
+  def step(item):
+    states, actions = to_device(item, device, channels_last)
+    optimizer.zero_grad()
+    with torch.autocast(device.type, dtype=torch.bfloat16, enabled=bf16):
+      loss = criterion(forward(states), actions)
+    loss.backward()
+    optimizer.step()
+    return len(actions)
+
+  for item in batches[:3]:
+    step(item)
+  if device.type == 'cuda':
+    torch.cuda.synchronize()
+  start = time.perf_counter()
+  samples = sum(step(item) for item in itertools.islice(itertools.cycle(batches), steps))
+  if device.type == 'cuda':
+    torch.cuda.synchronize()
+  return samples / (time.perf_counter() - start)
+
+
+def load_batches(replay_path, batch_size, count):
+  """
+  count training batches of real unit inputs from a recorded episode, with random labels
+  """
+  states = torch.from_numpy(np.concatenate(replay_inputs(replay_path)))
+  rng = np.random.default_rng(0)
+  batches = []
+  for _ in range(count):
+    idx = rng.choice(len(states), batch_size)
+    batches.append((states[idx], torch.from_numpy(rng.integers(5, size=batch_size))))
+  return batches
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='Training throughput of LuxNet under each device and CPU option')
+  parser.add_argument('--replay', default='replay.json', help='recorded episode the inputs come from')
+  parser.add_argument('--device', help='torch device, cuda when available otherwise cpu')
+  parser.add_argument('--threads', nargs='+', type=int, default=[torch.get_num_threads()])
+  parser.add_argument('--channels-last', nargs='+', type=int, default=[0, 1], choices=[0, 1])
+  parser.add_argument('--bf16', nargs='+', type=int, default=[0, 1], choices=[0, 1])
+  parser.add_argument('--compile', nargs='+', type=int, default=[0], choices=[0, 1])
+  parser.add_argument('--batch-size', type=int, default=64)
+  parser.add_argument('--steps', type=int, default=50)
+  args = parser.parse_args()
+
+  device = get_device(args.device)
+  batches = load_batches(args.replay, args.batch_size, 16)
+  print(f'device {device}, batch size {args.batch_size}, {args.steps} steps')
+  print(f'{"threads":>8}{"channels_last":>15}{"bf16":>6}{"compile":>9}{"samples/s":>11}')
+  for threads, channels_last, bf16, compile in itertools.product(args.threads, args.channels_last, args.bf16, args.compile):
+    torch.set_num_threads(threads)
+    rate = benchmark(batches, device, bool(channels_last), bool(bf16), bool(compile), args.steps)
+    print(f'{threads:>8}{channels_last:>15}{bf16:>6}{compile:>9}{rate:>11.1f}')
@@ -0,0 +1,108 @@
+import argparse
+import hashlib
+import json
+import sys
+import numpy as np
+from lux.game import Game
+from encoder import ObservationEncoder
+
+DIGESTS = 'replay-digests.json'
+
+
+def game_state(game):
+  """
+  Everything the agent reads from a Game, as plain Python values
+  """
+  cells = []
+  for row in game.map.map:
+    for cell in row:
+      resource = cell.resource
+      citytile = cell.citytile
+      cells.append((
+        int(cell.pos.x), int(cell.pos.y),
+        (str(resource.type), int(resource.amount)) if resource is not None and resource.amount else None,
+        float(cell.road),
+        (int(citytile.team), str(citytile.cityid), float(citytile.cooldown)) if citytile is not None else None,
+      ))
+  players = []
+  for player in game.players:
+    units = [
+      (str(u.id), int(u.type), int(u.team), int(u.pos.x), int(u.pos.y), float(u.cooldown),
+       int(u.cargo.wood), int(u.cargo.coal), int(u.cargo.uranium))
+      for u in player.units
+    ]
+    cities = [
+      (str(city_id), int(city.team), float(city.fuel), float(city.light_upkeep),
+       [(int(t.pos.x), int(t.pos.y), float(t.cooldown)) for t in city.citytiles])
+      for city_id, city in player.cities.items()
+    ]
+    players.append((int(player.research_points), int(player.city_tile_count), units, cities))
+  return cells, players
+
+
+def digest(value):
+  if isinstance(value, np.ndarray):
+    return hashlib.sha1(np.ascontiguousarray(value, dtype=np.float32).tobytes()).hexdigest()
+  return hashlib.sha1(repr(value).encode()).hexdigest()
+
+
+def replay_digests(steps):
+  """
+  Per step, the digest of the game state and of both players' inputs for
+  every unit on the map plus one that isn't, checking along the way that
+  incremental updates agree with a full rebuild
+  """
+  games = [Game(), Game(incremental=True)]
+  digests = {'game': [], 'encoder': []}
+  for i, step in enumerate(steps):
+    obs = step[0]['observation']
+    for game in games:
+      if i == 0:
+        game._initialize(obs['updates'])
+        game._update(obs['updates'][2:])
+      else:
+        game._update(obs['updates'])
+    full, incremental = (game_state(game) for game in games)
+    if full != incremental:
+      raise AssertionError(f'step {i}: the incremental game state differs from a full rebuild')
+    digests['game'].append(digest(full))
+
+    unit_ids = [u.split(' ')[3] for u in obs['updates'] if u.startswith('u ')] + ['u_missing']
+    digests['encoder'].append([
+      digest(ObservationEncoder(obs, player).make_inputs(unit_ids)) for player in range(2)
+    ])
+  return digests
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description=(
+    'Regression check of the lux game state and the observation encoder on a replay: incremental updates '
+    'must match a full rebuild, and both must match the digests recorded in ' + DIGESTS
+  ))
+  parser.add_argument('--replay', default='replay.json')
+  parser.add_argument('--digests', default=DIGESTS)
+  parser.add_argument('--update', action='store_true', help='record the current digests, for intended changes only')
+  args = parser.parse_args()
+
+  with open(args.replay) as f:
+    steps = json.load(f)['steps']
+  digests = replay_digests(steps)
+  if args.update:
+    with open(args.digests, 'w') as f:
+      json.dump(digests, f, indent=1)
+    print(f'recorded {len(steps)} steps to {args.digests}')
+    sys.exit()
+
+  with open(args.digests) as f:
+    expected = json.load(f)
+  failures = 0
+  for name in ['game', 'encoder']:
+    for i, (got, want) in enumerate(zip(digests[name], expected[name])):
+      if got != want:
+        print(f'step {i}: {name} output changed')
+        failures += 1
+  if len(digests['game']) != len(expected['game']):
+    print(f'{len(digests["game"])} steps, {len(expected["game"])} recorded')
+    failures += 1
+  print(f'{len(steps)} steps, {failures} mismatches')
+  sys.exit(1 if failures else 0)
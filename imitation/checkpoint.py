@@ -0,0 +1,65 @@
+import copy
+import os
+import random
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import torch
+
+
+def rng_state():
+  state = {
+    'python': random.getstate(),
+    'numpy': np.random.get_state(),
+    'torch': torch.get_rng_state(),
+  }
+  if torch.cuda.is_available():
+    state['cuda'] = torch.cuda.get_rng_state_all()
+  return state
+
+
+def set_rng_state(state):
+  random.setstate(state['python'])
+  np.random.set_state(state['numpy'])
+  torch.set_rng_state(state['torch'])
+  if 'cuda' in state and torch.cuda.is_available():
+    torch.cuda.set_rng_state_all(state['cuda'])
+
+
+def save_atomic(state, path):
+  """
+  torch.save to a temporary file renamed over path, so a run killed mid-write
+  leaves the previous checkpoint intact
+  """
+  tmp = f'{path}.tmp'
+  torch.save(state, tmp)
+  os.replace(tmp, path)
+
+
+def load(path):
+  return torch.load(path, map_location='cpu', weights_only=False)
+
+
+class CheckpointWriter:
+  """
+  Runs saves on one background thread, in submission order. Callers hand over
+  snapshots, never live tensors, since training keeps updating those.
+  """
+  def __init__(self):
+    self.executor = ThreadPoolExecutor(max_workers=1)
+    self.pending = []
+
+  def submit(self, fn, *args):
+    # Surface errors from earlier saves instead of losing them
+    for future in [f for f in self.pending if f.done()]:
+      self.pending.remove(future)
+      future.result()
+    self.pending.append(self.executor.submit(fn, *args))
+
+  def save(self, state, path):
+    self.submit(save_atomic, copy.deepcopy(state), path)
+
+  def close(self):
+    self.executor.shutdown(wait=True)
+    for future in self.pending:
+      future.result()
+    self.pending = []
@@ -0,0 +1,226 @@
+import hashlib
+import json
+import os
+import shutil
+from functools import partial
+from multiprocessing import Pool
+from pathlib import Path
+import numpy as np
+from torch.utils.data import Dataset
+from tqdm import tqdm
+from encoder import ENCODER_VERSION, ObservationEncoder, overlay_units
+from episodes import index_episodes, load_episode
+
+# Channels 2-14 vary across the map; 15-18 are constant per observation and
+# 19 follows from the map size
+PLANES = slice(2, 15)
+# Bump whenever the cache layout changes, it invalidates preprocessed datasets
+CACHE_VERSION = 4
+STORE_META = 'store.json'
+
+# The planes are mostly empty, so only their nonzero cells are stored, each
+# with its float32 value as encoded, so cached inputs equal what the agent sees
+CELL_DTYPE = np.dtype([
+  ('channel', np.int8),
+  ('x', np.int8),
+  ('y', np.int8),
+  ('value', np.float32),
+])
+
+OBSERVATION_DTYPE = np.dtype([
+  ('constants', np.float32, 4),
+  ('x_shift', np.int8),
+  ('y_shift', np.int8),
+])
+
+SAMPLE_DTYPE = np.dtype([
+  ('obs', np.int32),
+  ('x', np.int8),
+  ('y', np.int8),
+  ('channel', np.int8),
+  ('cargo', np.float32),
+  ('under', np.float32, 3),
+  ('label', np.int8),
+])
+
+
+def store_key(team_name):
+  """
+  Names the directory of team_name's preprocessed episodes, by the team whose
+  actions are imitated and the encoder and cache versions
+  """
+  return hashlib.sha1(f'{ENCODER_VERSION}:{CACHE_VERSION}:{team_name}'.encode()).hexdigest()[:16]
+
+
+def write_episode(obses, samples, path):
+  """
+  Encodes every observation of one episode once and writes the nonzero cells
+  of the shared planes with per-observation offsets into them, the
+  per-observation constants and the per-sample unit overlays and labels to
+  .npy files in path
+  """
+  tmp = Path(f'{path}.tmp')
+  shutil.rmtree(tmp, ignore_errors=True)
+  tmp.mkdir(parents=True)
+
+  observations = np.zeros(len(obses), dtype=OBSERVATION_DTYPE)
+  records = np.zeros(len(samples), dtype=SAMPLE_DTYPE)
+  by_obs = {}
+  for i, (obs_id, unit_id, label) in enumerate(samples):
+    by_obs.setdefault(obs_id, []).append((i, unit_id))
+    records[i]['label'] = label
+
+  cells = []
+  offsets = np.zeros(len(obses) + 1, dtype=np.int64)
+  for row, (obs_id, obs) in enumerate(obses.items()):
+    encoder = ObservationEncoder(obs)
+    planes = encoder.base[PLANES]
+    channel, x, y = np.nonzero(planes)
+    obs_cells = np.zeros(len(channel), dtype=CELL_DTYPE)
+    obs_cells['channel'], obs_cells['x'], obs_cells['y'] = channel, x, y
+    obs_cells['value'] = planes[channel, x, y]
+    cells.append(obs_cells)
+    offsets[row + 1] = offsets[row] + len(obs_cells)
+    observations[row] = (encoder.base[15:19, 0, 0], encoder.x_shift, encoder.y_shift)
+
+    for i, unit_id in by_obs.get(obs_id, []):
+      idx = encoder.unit_ids.get(unit_id)
+      if idx is None:
+        records[i]['x'] = -1
+      else:
+        records[i]['x'] = encoder.unit_x[idx]
+        records[i]['y'] = encoder.unit_y[idx]
+        records[i]['channel'] = encoder.unit_channel[idx]
+        records[i]['cargo'] = encoder.unit_cargo[idx]
+        records[i]['under'] = encoder.unit_under[idx]
+      records[i]['obs'] = row
+
+  np.save(tmp / 'cells.npy', np.concatenate(cells) if cells else np.zeros(0, dtype=CELL_DTYPE))
+  np.save(tmp / 'cell_offsets.npy', offsets)
+  np.save(tmp / 'observations.npy', observations)
+  np.save(tmp / 'samples.npy', records)
+  shutil.rmtree(path, ignore_errors=True)
+  os.replace(tmp, path)
+
+
+def preprocess_episode(job, team_name='Toad Brigade'):
+  filepath, path = job
+  write_episode(*load_episode(filepath, team_name), path)
+
+
+def prune(cache_dir, root, keep):
+  """
+  Deletes the episodes under root that aren't in keep, and the stores in
+  cache_dir left behind by other encoder or cache versions, or by layouts
+  from before stores were recorded in STORE_META
+  """
+  for path in Path(root).iterdir():
+    if path.is_dir() and path not in keep:
+      shutil.rmtree(path, ignore_errors=True)
+  for path in Path(cache_dir).iterdir():
+    if not path.is_dir() or path == root:
+      continue
+    try:
+      with open(path / STORE_META) as f:
+        meta = json.load(f)
+    except (OSError, ValueError):
+      meta = {}
+    if (meta.get('encoder_version'), meta.get('cache_version')) != (ENCODER_VERSION, CACHE_VERSION):
+      shutil.rmtree(path, ignore_errors=True)
+
+
+def preprocess(episode_dir, cache_dir, team_name='Toad Brigade', processes=1, index_path=None, prune_stale=True):
+  """
+  Returns the preprocessed directories of the episodes in episode_dir that
+  team_name won, in sorted order. Episodes are stored by content hash, so
+  only new or changed ones are encoded, over a pool of processes when
+  processes is more than 1, and the rest are reused as they are.
+
+  With prune_stale, everything else in cache_dir is deleted: episodes
+  episode_dir no longer holds, and data of older encoder or cache versions.
+  A cache_dir then serves one episode directory, stores of other teams are
+  kept.
+  """
+  index = index_episodes(episode_dir, processes, index_path)
+  root = Path(cache_dir) / store_key(team_name)
+  root.mkdir(parents=True, exist_ok=True)
+  with open(root / STORE_META, 'w') as f:
+    json.dump({'encoder_version': ENCODER_VERSION, 'cache_version': CACHE_VERSION, 'team_name': team_name}, f)
+  episodes = [(Path(episode_dir) / name, root / entry['hash']) for name, entry in index.items() if entry['winner'] == team_name]
+  if prune_stale:
+    prune(cache_dir, root, {path for _, path in episodes})
+  missing = [(filepath, path) for filepath, path in episodes if not path.exists()]
+  if missing:
+    print(f'preprocessing {len(missing)} of {len(episodes)} episodes')
+    encode = partial(preprocess_episode, team_name=team_name)
+    if processes == 1:
+      for _ in tqdm(map(encode, missing), total=len(missing)):
+        pass
+    else:
+      with Pool(processes) as pool:
+        for _ in tqdm(pool.imap_unordered(encode, missing), total=len(missing)):
+          pass
+  return [path for _, path in episodes]
+
+
+class CachedLuxDataset(Dataset):
+  """
+  Samples from preprocessed episodes, given by their directories. Plane cells
+  are memory-mapped read-only, so concurrent trainers and DataLoader workers
+  share one page-cached copy.
+  """
+  def __init__(self, paths, indices=None):
+    self.paths = paths = [Path(path) for path in paths]
+    self.cells = [np.load(path / 'cells.npy', mmap_mode='r') for path in paths]
+    self.cell_offsets = [np.load(path / 'cell_offsets.npy') for path in paths]
+    observations = [np.load(path / 'observations.npy') for path in paths]
+    samples = [np.load(path / 'samples.npy') for path in paths]
+    # Observations are numbered across all episodes, each sample points at its global row
+    counts = np.array([len(o) for o in observations], dtype=np.int64)
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    for start, episode_samples in zip(starts, samples):
+      episode_samples['obs'] += start
+    self.observations = np.concatenate(observations) if paths else np.zeros(0, dtype=OBSERVATION_DTYPE)
+    self.samples = np.concatenate(samples) if paths else np.zeros(0, dtype=SAMPLE_DTYPE)
+    self.episode = np.repeat(np.arange(len(paths)), counts)
+    self.row = np.arange(counts.sum()) - np.repeat(starts, counts)
+    self.indices = np.arange(len(self.samples)) if indices is None else np.asarray(indices)
+
+  def __getstate__(self):
+    # Reopen the memory maps rather than pickling their contents
+    return {'paths': self.paths, 'indices': self.indices}
+
+  def __setstate__(self, state):
+    self.__init__(state['paths'], state['indices'])
+
+  @property
+  def labels(self):
+    return np.asarray(self.samples['label'])
+
+  @property
+  def map_sizes(self):
+    obs = self.samples['obs'][self.indices]
+    return 32 - 2 * self.observations['x_shift'][obs].astype(np.int64)
+
+  def __len__(self):
+    return len(self.indices)
+
+  def __getitem__(self, idx):
+    sample = self.samples[self.indices[idx]]
+    obs = sample['obs']
+    observation = self.observations[obs]
+
+    b = np.zeros((1, 20, 32, 32), dtype=np.float32)
+    episode, row = self.episode[obs], self.row[obs]
+    offsets = self.cell_offsets[episode]
+    cells = self.cells[episode][offsets[row]:offsets[row + 1]]
+    b[0, PLANES.start + cells['channel'].astype(np.intp), cells['x'], cells['y']] = cells['value']
+    b[0, 15:19] = observation['constants'][:, None, None]
+    x_shift, y_shift = observation['x_shift'], observation['y_shift']
+    b[0, 19, x_shift:32 - x_shift, y_shift:32 - y_shift] = 1
+    if sample['x'] >= 0:
+      overlay_units(
+        b, np.zeros(1, dtype=np.intp), sample['x'][None], sample['y'][None],
+        sample['channel'][None].astype(np.intp), sample['cargo'][None], sample['under'][None]
+      )
+    return b[0], int(sample['label'])
@@ -0,0 +1,73 @@
+import contextlib
+import os
+import socket
+import torch
+import torch.distributed as dist
+
+
+def rank():
+  return dist.get_rank() if dist.is_initialized() else 0
+
+
+def world_size():
+  return dist.get_world_size() if dist.is_initialized() else 1
+
+
+def is_main():
+  return rank() == 0
+
+
+def free_port():
+  with socket.socket() as s:
+    s.bind(('127.0.0.1', 0))
+    return s.getsockname()[1]
+
+
+def _entry(rank, fn, world_size, port, args):
+  os.environ['MASTER_ADDR'] = '127.0.0.1'
+  os.environ['MASTER_PORT'] = str(port)
+  dist.init_process_group('gloo', rank=rank, world_size=world_size)
+  try:
+    fn(rank, world_size, *args)
+  finally:
+    dist.destroy_process_group()
+
+
+def launch(fn, world_size, *args):
+  """
+  Runs fn(rank, world_size, *args) in world_size local processes joined in a
+  gloo process group. One process runs fn in place, with no process group.
+  """
+  if world_size == 1:
+    return fn(0, 1, *args)
+  torch.multiprocessing.spawn(_entry, args=(fn, world_size, free_port(), args), nprocs=world_size)
+
+
+def all_reduce_sum(values):
+  """
+  values summed elementwise over all processes
+  """
+  if not dist.is_initialized():
+    return list(values)
+  t = torch.tensor(values, dtype=torch.float64)
+  dist.all_reduce(t)
+  return t.tolist()
+
+
+def wrap(model):
+  """
+  model wrapped in DistributedDataParallel inside a process group, as is otherwise
+  """
+  if not dist.is_initialized():
+    return model
+  return torch.nn.parallel.DistributedDataParallel(model)
+
+
+def join(module):
+  """
+  Lets processes that run out of batches early keep serving the gradient
+  all-reduces of the others, so uneven shards don't hang
+  """
+  if isinstance(module, torch.nn.parallel.DistributedDataParallel):
+    return module.join()
+  return contextlib.nullcontext()
@@ -0,0 +1,180 @@
+import hashlib
+import numpy as np
+import json
+import os
+from functools import partial
+from multiprocessing import Pool, cpu_count
+from pathlib import Path
+from packed import IdTable, PackedObservation
+from tqdm import tqdm
+
+def to_label(action):
+  strs = action.split(' ')
+  unit_id = strs[1]
+  if strs[0] == 'm':
+    label = {'c': None, 'n': 0, 's': 1, 'w': 2, 'e': 3}[strs[2]]
+  elif strs[0] == 'bcity':
+    label = 4
+  else:
+    label = None
+  return unit_id, label
+
+def depleted_resources(obs):
+  for u in obs['updates']:
+    if u.split(' ')[0] == 'r':
+      return False
+  return True
+
+def list_episodes(episode_dir):
+  return [path for path in Path(episode_dir).glob('*.json') if 'output' not in path.name and '-aug' not in path.name]
+
+# Sidecar index of episode metadata, kept in the episode directory by default
+INDEX_NAME = '.episode-index'
+
+def index_location(episode_dir, cache_dir=None):
+  """
+  Path of the index of episode_dir: INDEX_NAME inside it, or with cache_dir
+  a file there named after the episode directory, so read-only episode
+  archives can be indexed too
+  """
+  if cache_dir is None:
+    return Path(episode_dir) / INDEX_NAME
+  name = hashlib.sha1(str(Path(episode_dir).resolve()).encode()).hexdigest()[:16]
+  return Path(cache_dir) / f'{INDEX_NAME}-{name}'
+
+def read_metadata(filepath):
+  """
+  Index entry of one episode file: id, teams, winner, step count, map size
+  and a hash of its content
+  """
+  with open(filepath, 'rb') as f:
+    content = f.read()
+  json_load = json.loads(content)
+  teams = json_load['info']['TeamNames']
+  obs = json_load['steps'][0][0]['observation']
+  return {
+    'episode_id': json_load['info']['EpisodeId'],
+    'teams': teams,
+    'winner': teams[int(np.argmax([r or 0 for r in json_load['rewards']]))],
+    'steps': len(json_load['steps']),
+    'width': obs['width'],
+    'height': obs['height'],
+    'hash': hashlib.sha1(content).hexdigest(),
+  }
+
+def index_episodes(episode_dir, processes=1, index_path=None):
+  """
+  Metadata of every episode in episode_dir, by file name. Entries persist in
+  the index file at index_path, by default the INDEX_NAME file in
+  episode_dir; only files that are new or whose size or mtime changed are
+  read again, and entries of deleted files are dropped.
+  """
+  index_path = Path(index_path or index_location(episode_dir))
+  index = {}
+  if index_path.exists():
+    with open(index_path) as f:
+      index = json.load(f)
+
+  stats = {path.name: path.stat() for path in sorted(list_episodes(episode_dir))}
+  stale = [
+    name for name, stat in stats.items()
+    if name not in index or (index[name]['size'], index[name]['mtime']) != (stat.st_size, stat.st_mtime_ns)
+  ]
+  removed = [name for name in index if name not in stats]
+  if not stale and not removed:
+    return index
+
+  paths = [Path(episode_dir) / name for name in stale]
+  if processes == 1:
+    entries = list(tqdm(map(read_metadata, paths), total=len(paths)))
+  else:
+    with Pool(processes) as pool:
+      entries = list(tqdm(pool.imap(read_metadata, paths), total=len(paths)))
+  for name, entry in zip(stale, entries):
+    index[name] = {**entry, 'size': stats[name].st_size, 'mtime': stats[name].st_mtime_ns}
+  for name in removed:
+    del index[name]
+
+  index = dict(sorted(index.items()))
+  index_path.parent.mkdir(parents=True, exist_ok=True)
+  tmp = index_path.with_name(index_path.name + '.tmp')
+  with open(tmp, 'w') as f:
+    json.dump(index, f)
+  os.replace(tmp, index_path)
+  return index
+
+def select_episodes(episode_dir, team_name=None, processes=1, index_path=None):
+  """
+  Paths of the episodes in episode_dir won by team_name, every episode
+  without one, in sorted order. Only files the index hasn't seen are opened.
+  """
+  index = index_episodes(episode_dir, processes, index_path)
+  return [
+    Path(episode_dir) / name for name, entry in index.items()
+    if team_name is None or entry['winner'] == team_name
+  ]
+
+def load_episode(filepath, team_name='Toad Brigade'):
+  """
+  Packed observations and (obs_id, unit_id, label) samples of one episode
+  file, both empty unless team_name won it. The observations share one id
+  table per episode.
+  """
+  obses = {}
+  ids = IdTable()
+  samples = []
+  append = samples.append
+  with open(filepath) as f:
+    json_load = json.load(f)
+
+  ep_id = json_load['info']['EpisodeId']
+  index = np.argmax([r or 0 for r in json_load['rewards']])
+  if json_load['info']['TeamNames'][index] != team_name:
+    return obses, samples
+
+  for i in range(len(json_load['steps'])-1):
+    if json_load['steps'][i][index]['status'] == 'ACTIVE':
+      actions = json_load['steps'][i+1][index]['action']
+      obs = json_load['steps'][i][0]['observation']
+      
+      if depleted_resources(obs):
+        break
+      
+      obs['player'] = index
+      obs = PackedObservation(obs, ids)
+      obs_id = f'{ep_id}_{i}'
+      obses[obs_id] = obs
+                      
+      for action in actions:
+        unit_id, label = to_label(action)
+        if label is not None:
+          append((obs_id, unit_id, label))
+
+  return obses, samples
+
+def create_dataset_from_json(episode_dir, team_name='Toad Brigade', processes=1, index_path=None):
+  """
+  Loads the episodes in episode_dir that team_name won, over a pool of
+  processes when processes is more than 1 (None uses every core). The index
+  picks them out, so other files aren't read. Episodes are read in sorted
+  path order and merged in that order whatever the pool size, so the result,
+  and the seeded split made from it, is identical across runs and machines.
+  """
+  obses = {}
+  samples = []
+  episodes = select_episodes(episode_dir, team_name, processes, index_path)
+  load = partial(load_episode, team_name=team_name)
+  if processes == 1:
+    results = tqdm(map(load, episodes), total=len(episodes))
+    for episode_obses, episode_samples in results:
+      obses.update(episode_obses)
+      samples.extend(episode_samples)
+  else:
+    chunksize = max(1, len(episodes) // (8 * (processes or cpu_count())))
+    with Pool(processes) as pool:
+      # imap yields in submission order, so the merge never depends on worker timing
+      for episode_obses, episode_samples in tqdm(pool.imap(load, episodes, chunksize), total=len(episodes)):
+        obses.update(episode_obses)
+        samples.extend(episode_samples)
+
+  return obses, samples
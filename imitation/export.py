@@ -0,0 +1,146 @@
+import argparse
+import json
+import torch
+from torch import nn
+from torch.ao.nn.quantized import FloatFunctional
+from torch.ao.quantization import QuantStub, DeQuantStub, get_default_qconfig, prepare, convert, quantize_dynamic
+from torch.nn.utils.fusion import fuse_conv_bn_eval
+from backends import load_model
+from encoder import ObservationEncoder
+from numpy_net import save_npz
+from train import LuxNet
+
+FORMATS = ['fp32', 'int8-dynamic', 'int8-static', 'frozen', 'onnx', 'npz']
+
+
+def load_luxnet(path='model.pth'):
+  """
+  Rebuilds an eager LuxNet from the traced model train.py saves
+  """
+  model = LuxNet()
+  model.load_state_dict(torch.jit.load(path).state_dict())
+  return model.eval()
+
+
+def fold_bn(block):
+  """
+  Returns the Conv2d of a BasicConv2d with its BatchNorm folded in
+  """
+  if block.bn is None:
+    return block.conv
+  return fuse_conv_bn_eval(block.conv, block.bn)
+
+
+class QuantizableLuxNet(nn.Module):
+  """
+  LuxNet with BN folded into the convolutions, the conv trunk in int8 and the
+  masked-sum head in fp32
+  """
+  def __init__(self, model):
+    super().__init__()
+    self.quant = QuantStub()
+    self.dequant = DeQuantStub()
+    self.conv0 = fold_bn(model.conv0)
+    self.relu0 = nn.ReLU()
+    self.blocks = nn.ModuleList([fold_bn(block) for block in model.blocks])
+    self.adds = nn.ModuleList([FloatFunctional() for _ in model.blocks])
+    self.head_p = model.head_p
+
+  def forward(self, x):
+    h = self.relu0(self.conv0(self.quant(x)))
+    for block, add in zip(self.blocks, self.adds):
+      h = add.add_relu(h, block(h))
+    h = self.dequant(h)
+    h_head = (h * x[:,:1]).view(h.size(0), h.size(1), -1).sum(-1)
+    p = self.head_p(h_head)
+    return p
+
+
+def replay_inputs(replay_path, limit=None, border=None):
+  """
+  Every acting player's per-unit inputs from a recorded episode, one batch per
+  step, cropped to the map plus border cells when given
+  """
+  with open(replay_path) as f:
+    replay = json.load(f)
+
+  batches = []
+  for step in replay['steps'][:-1]:
+    obs = step[0]['observation']
+    for player in range(2):
+      unit_ids = [u.split(' ')[3] for u in obs['updates'] if u.startswith('u ') and u.split(' ')[2] == str(player)]
+      if unit_ids:
+        batches.append(ObservationEncoder(obs, player).make_inputs(unit_ids, border))
+  return batches[:limit]
+
+
+def export(model, fmt, path, calibration=None, crop_border=None):
+  """
+  Writes model in one of FORMATS. int8-static needs calibration batches.
+  Everything but onnx and npz is a TorchScript file for the torchscript backend.
+
+  Every format takes inputs of any height and width: the trunk is convolutional
+  and the head sums over the map. With a crop_border the file tells the agent
+  to feed maps cropped to their size plus that border instead of the 32x32
+  canvas, which the weights have to be trained for or checked against.
+  """
+  example = torch.rand(1, 20, 32, 32)
+  model = model.eval()
+  extra_files = {} if crop_border is None else {'crop_border': str(crop_border)}
+
+  if fmt == 'fp32':
+    torch.jit.trace(model, example).save(path, _extra_files=extra_files)
+  elif fmt == 'int8-dynamic':
+    # Only the linear head has a dynamic int8 kernel, the convolutions stay fp32
+    quantized = quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
+    torch.jit.trace(quantized, example).save(path, _extra_files=extra_files)
+  elif fmt == 'int8-static':
+    quantized = QuantizableLuxNet(model).eval()
+    quantized.qconfig = get_default_qconfig('x86')
+    quantized.head_p.qconfig = None
+    prepare(quantized, inplace=True)
+    with torch.no_grad():
+      for batch in calibration:
+        quantized(torch.from_numpy(batch))
+    convert(quantized, inplace=True)
+    torch.jit.trace(quantized, example).save(path, _extra_files=extra_files)
+  elif fmt == 'frozen':
+    # optimize_for_inference output can't be serialized, backends.load_model
+    # reruns it on load for files tagged as frozen
+    frozen = torch.jit.freeze(torch.jit.trace(model, example))
+    frozen.save(path, _extra_files={**extra_files, 'format': 'frozen'})
+  elif fmt == 'onnx':
+    torch.onnx.export(
+      model, (example,), path,
+      input_names=['x'], output_names=['p'],
+      dynamic_axes={'x': {0: 'batch', 2: 'height', 3: 'width'}, 'p': {0: 'batch'}},
+      dynamo=False
+    )
+    if crop_border is not None:
+      import onnx
+      proto = onnx.load(path)
+      onnx.helper.set_model_props(proto, extra_files)
+      onnx.save(proto, path)
+  elif fmt == 'npz':
+    save_npz(model, path, crop_border)
+  else:
+    raise ValueError(f'Unknown format {fmt}, expected one of {FORMATS}')
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='Export LuxNet for inference')
+  parser.add_argument('format', choices=FORMATS)
+  parser.add_argument('output')
+  parser.add_argument('--model', default='model.pth', help='traced fp32 model written by train.py')
+  parser.add_argument('--calibration', default='replay.json', help='replay whose observations calibrate int8-static')
+  parser.add_argument('--calibration-steps', type=int, default=200)
+  parser.add_argument('--crop-border', type=int, help='run on maps cropped to their size plus this border, by default as --model was trained')
+  args = parser.parse_args()
+
+  crop_border = args.crop_border
+  if crop_border is None:
+    crop_border = load_model(args.model, warmup=False).crop_border
+  calibration = None
+  if args.format == 'int8-static':
+    calibration = replay_inputs(args.calibration, args.calibration_steps, crop_border)
+  export(load_luxnet(args.model), args.format, args.output, calibration, crop_border)
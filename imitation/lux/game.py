@@ -1,11 +1,34 @@
+from typing import List
+
+import numpy as np
+
 from .constants import Constants
-from .game_map import GameMap
-from .game_objects import Player, Unit, City, CityTile
+from .game_map import GameMap, Position
+from .game_objects import Player, Unit, City, CityTile, UNIT_DTYPE
 
 INPUT_CONSTANTS = Constants.INPUT_CONSTANTS
 
 
+class TurnDelta:
+    """
+    what changed since the previous turn, only tracked by incremental updates
+    """
+    def __init__(self):
+        self.spawned: List[Unit] = []
+        self.died: List[Unit] = []
+        self.depleted: List[Position] = []
+        self.built: List[CityTile] = []
+        self.destroyed: List[CityTile] = []
+
+
 class Game:
+    def __init__(self, incremental=False):
+        """
+        incremental: keep the map and entity objects alive between turns and only apply what changed
+        """
+        self.incremental = incremental
+        self.delta: TurnDelta = None
+
     def _initialize(self, messages):
         """
         initialize state
@@ -34,9 +57,33 @@ class Game:
         """
         update state
         """
-        self.map = GameMap(self.map_width, self.map_height)
         self.turn += 1
-        self._reset_player_states()
+        research, units, cities, citytiles, resources, roads = self._parse(messages)
+        if self.incremental:
+            resource_type = self.map.resource_type.copy()
+            self._reconcile(units, cities, citytiles)
+        else:
+            self._rebuild(units, cities, citytiles)
+        for team, points in research:
+            self.players[team].research_points = points
+        for team, *_ in citytiles:
+            self.players[team].city_tile_count += 1
+        self._set_grids(resources, roads)
+        if self.incremental:
+            for y, x in np.argwhere((resource_type != 0) & (self.map.resource_type == 0)):
+                self.delta.depleted.append(self.map.get_cell(x, y).pos)
+
+    def _parse(self, messages):
+        """
+        this turn's updates as records: research points, unit rows per team,
+        cities, city tiles, and resource and road columns
+        """
+        research = []
+        units = ([], [])
+        cities = []
+        citytiles = []
+        resources = ([], [], [], [])
+        roads = ([], [], [])
 
         for update in messages:
             if update == "D_DONE":
@@ -45,13 +92,14 @@ class Game:
             input_identifier = strs[0]
             if input_identifier == INPUT_CONSTANTS.RESEARCH_POINTS:
                 team = int(strs[1])
-                self.players[team].research_points = int(strs[2])
+                research.append((team, int(strs[2])))
             elif input_identifier == INPUT_CONSTANTS.RESOURCES:
                 r_type = strs[1]
                 x = int(strs[2])
                 y = int(strs[3])
                 amt = int(float(strs[4]))
-                self.map._setResource(r_type, x, y, amt)
+                for column, value in zip(resources, (r_type, x, y, amt)):
+                    column.append(value)
             elif input_identifier == INPUT_CONSTANTS.UNITS:
                 unittype = int(strs[1])
                 team = int(strs[2])
@@ -62,25 +110,110 @@ class Game:
                 wood = int(strs[7])
                 coal = int(strs[8])
                 uranium = int(strs[9])
-                self.players[team].units.append(Unit(team, unittype, unitid, x, y, cooldown, wood, coal, uranium))
+                units[team].append((unitid, team, unittype, x, y, cooldown, wood, coal, uranium))
             elif input_identifier == INPUT_CONSTANTS.CITY:
                 team = int(strs[1])
                 cityid = strs[2]
                 fuel = float(strs[3])
                 lightupkeep = float(strs[4])
-                self.players[team].cities[cityid] = City(team, cityid, fuel, lightupkeep)
+                cities.append((team, cityid, fuel, lightupkeep))
             elif input_identifier == INPUT_CONSTANTS.CITY_TILES:
                 team = int(strs[1])
                 cityid = strs[2]
                 x = int(strs[3])
                 y = int(strs[4])
                 cooldown = float(strs[5])
-                city = self.players[team].cities[cityid]
-                citytile = city._add_city_tile(x, y, cooldown)
-                self.map.get_cell(x, y).citytile = citytile
-                self.players[team].city_tile_count += 1;
+                citytiles.append((team, cityid, x, y, cooldown))
             elif input_identifier == INPUT_CONSTANTS.ROADS:
                 x = int(strs[1])
                 y = int(strs[2])
                 road = float(strs[3])
-                self.map.get_cell(x, y).road = road
+                for column, value in zip(roads, (x, y, road)):
+                    column.append(value)
+
+        return research, units, cities, citytiles, resources, roads
+
+    def _rebuild(self, units, cities, citytiles):
+        """
+        a new map and new units, cities and city tiles from this turn's records
+        """
+        self.map = GameMap(self.map_width, self.map_height)
+        self._reset_player_states()
+        for team, cityid, fuel, lightupkeep in cities:
+            self.players[team].cities[cityid] = City(team, cityid, fuel, lightupkeep)
+        for team, cityid, x, y, cooldown in citytiles:
+            citytile = self.players[team].cities[cityid]._add_city_tile(x, y, cooldown, self.map)
+            self.map.get_cell(x, y).citytile = citytile
+        for team, rows in enumerate(units):
+            self.players[team]._set_unit_table(np.array(rows, dtype=UNIT_DTYPE), game_map=self.map)
+
+    def _reconcile(self, units, cities, citytiles):
+        """
+        apply this turn's records to the map and the units, cities and city tiles of the previous
+        turn, reusing those that survive, and record what changed in delta
+        """
+        self.delta = delta = TurnDelta()
+        prev_units = {unit.id: unit for player in self.players for unit in player.units}
+        prev_cities = {city.cityid: city for player in self.players for city in player.cities.values()}
+        prev_citytiles = {
+            (citytile.pos.x, citytile.pos.y): citytile
+            for city in prev_cities.values() for citytile in city.citytiles
+        }
+        self._reset_player_states()
+
+        for team, cityid, fuel, lightupkeep in cities:
+            city = prev_cities.get(cityid)
+            if city is None:
+                city = City(team, cityid, fuel, lightupkeep)
+            else:
+                city.fuel = fuel
+                city.light_upkeep = lightupkeep
+                city.citytiles = []
+            self.players[team].cities[cityid] = city
+        for team, cityid, x, y, cooldown in citytiles:
+            city = self.players[team].cities[cityid]
+            citytile = prev_citytiles.get((x, y))
+            if citytile is None or citytile.team != team:
+                citytile = city._add_city_tile(x, y, cooldown, self.map)
+                self.map.get_cell(x, y).citytile = citytile
+                delta.built.append(citytile)
+            else:
+                del prev_citytiles[x, y]
+                # cities merge when they grow into each other
+                citytile.cityid = cityid
+                citytile.cooldown = cooldown
+                city.citytiles.append(citytile)
+
+        # rebind the surviving Unit views to this turn's rows
+        for team, rows in enumerate(units):
+            table = np.array(rows, dtype=UNIT_DTYPE)
+            views = []
+            for i, row in enumerate(rows):
+                unit = prev_units.pop(row[0], None)
+                if unit is None:
+                    unit = Unit._view(table, i, self.map)
+                    delta.spawned.append(unit)
+                else:
+                    unit._bind(table, i, self.map)
+                views.append(unit)
+            self.players[team]._set_unit_table(table, views, self.map)
+        delta.died = list(prev_units.values())
+        for (x, y), citytile in prev_citytiles.items():
+            cell = self.map.get_cell(x, y)
+            if cell.citytile is citytile:
+                cell.citytile = None
+            delta.destroyed.append(citytile)
+
+    def _set_grids(self, resources, roads):
+        """
+        scatter this turn's resources and roads into the map arrays, clearing the previous values
+        """
+        r_types, xs, ys, amounts = resources
+        self.map.resource_type[:] = 0
+        self.map.resource_amount[:] = 0
+        if r_types:
+            self.map._setResources(r_types, xs, ys, amounts)
+        xs, ys, levels = roads
+        self.map.road[:] = 0
+        if levels:
+            self.map.road[ys, xs] = levels
@@ -0,0 +1,108 @@
+import json
+import sys
+import time
+
+DONE = b'D_DONE'
+CHUNK_SIZE = 1 << 16
+
+
+class Observation(dict):
+  """
+  Keys readable as attributes too, like the observations kaggle_environments passes agents
+  """
+  def __getattr__(self, name):
+    try:
+      return self[name]
+    except KeyError:
+      raise AttributeError(name)
+
+  def __setattr__(self, name, value):
+    self[name] = value
+
+
+def read_turns(stream):
+  """
+  Yields each turn's update lines from a binary stream, split at D_DONE.
+  Reads whatever the stream has available instead of a line at a time, so it
+  never blocks waiting for more than the engine has sent.
+  """
+  buffer = b''
+  while True:
+    chunk = stream.read1(CHUNK_SIZE)
+    if not chunk:
+      return
+    buffer += chunk
+    while True:
+      end = buffer.find(DONE)
+      if end < 0:
+        break
+      yield [line for line in buffer[:end].decode().splitlines() if line]
+      buffer = buffer[end + len(DONE):]
+
+
+def read_replay(path, player):
+  """
+  Yields each turn's update lines from a kaggle_environments replay JSON, as seen by player
+  """
+  with open(path) as f:
+    steps = json.load(f)['steps']
+  for i, step in enumerate(steps[:-1]):
+    updates = list(step[0]['observation']['updates'])
+    if i == 0:
+      # The first update names the receiving player
+      updates[0] = str(player)
+    yield updates
+
+
+def play(turns, agent, write):
+  """
+  Runs agent on every turn and passes its actions to write. The first turn
+  holds the player id and map size ahead of the usual updates.
+  """
+  observation = Observation()
+  for step, updates in enumerate(turns):
+    if step == 0:
+      observation.player = int(updates[0])
+      observation.width, observation.height = map(int, updates[1].split(' '))
+    observation.updates = updates
+    observation.step = step
+    write(agent(observation, None))
+
+
+def play_stdio(agent):
+  out = sys.stdout.buffer
+
+  def write(actions):
+    out.write((','.join(actions) + '\nD_FINISH\n').encode())
+    out.flush()
+
+  play(read_turns(sys.stdin.buffer), agent, write)
+
+
+def play_file(agent, path, player=0):
+  """
+  Replays a recorded episode offline and reports agent turn throughput on stderr.
+  path is either a replay JSON or a raw dump of the engine's stdin.
+  """
+  if path.endswith('.json'):
+    turns = list(read_replay(path, player))
+  else:
+    with open(path, 'rb') as f:
+      turns = list(read_turns(f))
+
+  latencies = []
+  start = time.perf_counter()
+
+  def write(actions):
+    nonlocal start
+    now = time.perf_counter()
+    latencies.append(now - start)
+    start = now
+
+  play(turns, agent, write)
+  total = sum(latencies)
+  print(
+    f'{len(latencies)} turns in {total:.2f}s, {total / len(latencies) * 1000:.1f} ms/turn, '
+    f'max {max(latencies) * 1000:.1f} ms, {len(latencies) / total:.1f} turns/s',
+    file=sys.stderr
+  )
@@ -0,0 +1,58 @@
+import json
+import resource
+import time
+
+
+def peak_rss_mb():
+  # ru_maxrss is in KB on Linux
+  return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class PassTimer:
+  """
+  Wall time of one pass over a DataLoader, split into time blocked waiting for
+  the next batch and time spent on each batch once it arrived (forward,
+  backward and optimizer step)
+  """
+  def __init__(self):
+    self.start = time.perf_counter()
+    self.data_wait = 0.0
+    self.compute = 0.0
+    self.samples = 0
+
+  def batches(self, loader):
+    it = iter(loader)
+    while True:
+      start = time.perf_counter()
+      try:
+        item = next(it)
+      except StopIteration:
+        return
+      ready = time.perf_counter()
+      self.data_wait += ready - start
+      yield item
+      self.compute += time.perf_counter() - ready
+
+  def summary(self):
+    seconds = time.perf_counter() - self.start
+    return {
+      'seconds': seconds,
+      'data_wait': self.data_wait,
+      'compute': self.compute,
+      'samples': self.samples,
+      'samples_per_sec': self.samples / seconds if seconds else 0.0,
+    }
+
+
+class TrainingLog:
+  """
+  Appends one JSON object per epoch to path, flushed as it goes so a killed
+  run keeps everything up to its last epoch
+  """
+  def __init__(self, path):
+    self.path = path
+
+  def write(self, record):
+    record = {**record, 'peak_rss_mb': peak_rss_mb(), 'time': time.time()}
+    with open(self.path, 'a') as f:
+      f.write(json.dumps(record) + '\n')
@@ -1,15 +1,26 @@
+import argparse
+import contextlib
+import copy
 import numpy as np
-import json
-from pathlib import Path
 import os
 import random
-from tqdm.notebook import tqdm
+from tqdm import tqdm
 import torch
 from torch import nn
 import torch.nn.functional as F
-from torch.utils.data import Dataset, DataLoader
+from torch.utils.data import Dataset, IterableDataset, DataLoader, get_worker_info
 import torch.optim as optim
 from sklearn.model_selection import train_test_split
+from encoder import ObservationEncoder, overlay_units
+from packed import PackedObservations
+from episodes import create_dataset_from_json, index_location, load_episode, select_episodes
+from numpy_net import save_npz
+from dataset_cache import preprocess, CachedLuxDataset
+from augment import AugmentCollate
+import checkpoint
+import distributed
+from telemetry import PassTimer, TrainingLog
+from batching import ObservationBatchSampler, ObservationCollate, ShardSampler, MapSizeBatchSampler, CropCollate
 
 def seed_everything(seed_value):
   random.seed(seed_value)
@@ -23,147 +34,148 @@ def seed_everything(seed_value):
     torch.backends.cudnn.deterministic = True
     torch.backends.cudnn.benchmark = True
 
-def to_label(action):
-  strs = action.split(' ')
-  unit_id = strs[1]
-  if strs[0] == 'm':
-    label = {'c': None, 'n': 0, 's': 1, 'w': 2, 'e': 3}[strs[2]]
-  elif strs[0] == 'bcity':
-    label = 4
-  else:
-    label = None
-  return unit_id, label
-
-def depleted_resources(obs):
-  for u in obs['updates']:
-    if u.split(' ')[0] == 'r':
-      return False
-  return True
-
-def create_dataset_from_json(episode_dir, team_name='Toad Brigade'): 
-  obses = {}
-  samples = []
-  append = samples.append
-  episodes = [path for path in Path(episode_dir).glob('*.json') if 'output' not in path.name and '-aug' not in path.name]
-  for filepath in tqdm(episodes):
-    with open(filepath) as f:
-      json_load = json.load(f)
-
-    ep_id = json_load['info']['EpisodeId']
-    index = np.argmax([r or 0 for r in json_load['rewards']])
-    if json_load['info']['TeamNames'][index] != team_name:
-      continue
-
-    for i in range(len(json_load['steps'])-1):
-      if json_load['steps'][i][index]['status'] == 'ACTIVE':
-        actions = json_load['steps'][i+1][index]['action']
-        obs = json_load['steps'][i][0]['observation']
-        
-        if depleted_resources(obs):
-          break
-        
-        obs['player'] = index
-        obs = dict([
-          (k,v) for k,v in obs.items() 
-          if k in ['step', 'updates', 'player', 'width', 'height']
-        ])
-        obs_id = f'{ep_id}_{i}'
-        obses[obs_id] = obs
-                        
-        for action in actions:
-          unit_id, label = to_label(action)
-          if label is not None:
-            append((obs_id, unit_id, label))
-
-  return obses, samples
-
 # Input for Neural Network
 def make_input(obs, unit_id):
-  width, height = obs['width'], obs['height']
-  x_shift = (32 - width) // 2
-  y_shift = (32 - height) // 2
-  cities = {}
-  
-  b = np.zeros((20, 32, 32), dtype=np.float32)
-  
-  for update in obs['updates']:
-    strs = update.split(' ')
-    input_identifier = strs[0]
-    
-    if input_identifier == 'u':
-      x = int(strs[4]) + x_shift
-      y = int(strs[5]) + y_shift
-      wood = int(strs[7])
-      coal = int(strs[8])
-      uranium = int(strs[9])
-      if unit_id == strs[3]:
-        # Position and Cargo
-        b[:2, x, y] = (
-          1,
-          (wood + coal + uranium) / 100
-        )
-      else:
-        # Units
-        team = int(strs[2])
-        cooldown = float(strs[6])
-        idx = 2 + (team - obs['player']) % 2 * 3
-        b[idx:idx + 3, x, y] = (
-          1,
-          cooldown / 6,
-          (wood + coal + uranium) / 100
-        )
-    elif input_identifier == 'ct':
-      # CityTiles
-      team = int(strs[1])
-      city_id = strs[2]
-      x = int(strs[3]) + x_shift
-      y = int(strs[4]) + y_shift
-      idx = 8 + (team - obs['player']) % 2 * 2
-      b[idx:idx + 2, x, y] = (
-        1,
-        cities[city_id]
-      )
-    elif input_identifier == 'r':
-      # Resources
-      r_type = strs[1]
-      x = int(strs[2]) + x_shift
-      y = int(strs[3]) + y_shift
-      amt = int(float(strs[4]))
-      b[{'wood': 12, 'coal': 13, 'uranium': 14}[r_type], x, y] = amt / 800
-    elif input_identifier == 'rp':
-      # Research Points
-      team = int(strs[1])
-      rp = int(strs[2])
-      b[15 + (team - obs['player']) % 2, :] = min(rp, 200) / 200
-    elif input_identifier == 'c':
-      # Cities
-      city_id = strs[2]
-      fuel = float(strs[3])
-      lightupkeep = float(strs[4])
-      cities[city_id] = min(fuel / lightupkeep, 10) / 10
-  
-  # Day/Night Cycle
-  b[17, :] = obs['step'] % 40 / 40
-  # Turns
-  b[18, :] = obs['step'] / 360
-  # Map Size
-  b[19, x_shift:32 - x_shift, y_shift:32 - y_shift] = 1
+  return ObservationEncoder(obs).make_input(unit_id)
 
-  return b
+SAMPLE_DTYPE = np.dtype([
+  ('obs', np.int32),
+  ('unit', np.int32),
+  ('action', np.int8),
+])
+
+def shared_array(array):
+  """
+  Moves a 1-d NumPy array into a shared memory tensor of its bytes
+  """
+  return torch.from_numpy(np.ascontiguousarray(array).view(np.uint8)).share_memory_()
 
 class LuxDataset(Dataset):
+  """
+  The observations samples refer to are packed into flat arrays and each
+  sample becomes an (observation, unit row, action) record. All of it lives
+  in shared memory, so DataLoader workers, forked or spawned, read one copy
+  instead of each getting the Python dicts.
+  """
   def __init__(self, obses, samples):
-    self.obses = obses
-    self.samples = samples
+    rows = {}
+    unit_rows = {}
+    records = np.zeros(len(samples), dtype=SAMPLE_DTYPE)
+    for i, (obs_id, unit_id, action) in enumerate(samples):
+      if obs_id not in rows:
+        rows[obs_id] = len(rows)
+        unit_rows[obs_id] = {name: row for row, name in enumerate(obses[obs_id].unit_names())}
+      records[i] = (rows[obs_id], unit_rows[obs_id].get(unit_id, -1), action)
+
+    arrays = PackedObservations.concatenate([obses[obs_id] for obs_id in rows]).arrays
+    arrays['samples'] = records
+    self.dtypes = {name: array.dtype for name, array in arrays.items()}
+    self.tensors = {name: shared_array(array) for name, array in arrays.items()}
+    self._bind()
+
+  def _bind(self):
+    arrays = {name: tensor.numpy().view(self.dtypes[name]) for name, tensor in self.tensors.items()}
+    self.samples = arrays.pop('samples')
+    self.obses = PackedObservations(arrays)
+
+  def __getstate__(self):
+    return {'dtypes': self.dtypes, 'tensors': self.tensors}
+
+  def __setstate__(self, state):
+    self.__dict__.update(state)
+    self._bind()
     
   def __len__(self):
     return len(self.samples)
 
+  @property
+  def map_sizes(self):
+    return self.obses.arrays['meta']['width'][self.samples['obs']].astype(np.int64)
+
   def __getitem__(self, idx):
-    obs_id, unit_id, action = self.samples[idx]
-    obs = self.obses[obs_id]
-    state = make_input(obs, unit_id)
-    return state, action
+    obs, unit, action = self.samples[idx]
+    state = ObservationEncoder(self.obses[obs]).make_rows([unit])[0]
+    return state, int(action)
+
+  def encode_batch(self, indices):
+    """
+    (states, actions) for the samples at indices. Each observation among them
+    is encoded once and the units are overlaid on all rows in one go.
+    """
+    samples = self.samples[np.asarray(indices)]
+    units = samples['unit'].astype(np.intp)
+    states = np.empty((len(samples), 20, 32, 32), dtype=np.float32)
+    x, y, channel = (np.zeros(len(samples), dtype=np.intp) for _ in range(3))
+    cargo = np.zeros(len(samples), dtype=np.float32)
+    under = np.zeros((len(samples), 3), dtype=np.float32)
+
+    order = np.argsort(samples['obs'], kind='stable')
+    obs_rows, starts = np.unique(samples['obs'][order], return_index=True)
+    for obs, rows in zip(obs_rows, np.split(order, starts[1:])):
+      encoder = ObservationEncoder(self.obses[obs])
+      states[rows] = encoder.base
+      rows = rows[units[rows] >= 0]
+      idx = units[rows]
+      x[rows], y[rows], channel[rows] = encoder.unit_x[idx], encoder.unit_y[idx], encoder.unit_channel[idx]
+      cargo[rows], under[rows] = encoder.unit_cargo[idx], encoder.unit_under[idx]
+
+    rows = np.flatnonzero(units >= 0)
+    overlay_units(states, rows, x[rows], y[rows], channel[rows], cargo[rows], under[rows])
+    return states, samples['action'].astype(np.int64)
+
+class StreamingLuxDataset(IterableDataset):
+  """
+  Samples of the episodes at paths, read one file at a time instead of held in
+  RAM, encoded like LuxDataset. With shuffle, episodes are visited in a fresh
+  order every epoch and samples leave through a buffer_size shuffle buffer.
+  DataLoader workers, and the processes of a process group, each take every
+  n-th episode of the same order, so no sample is produced twice.
+  """
+  def __init__(self, paths, team_name='Toad Brigade', shuffle=True, buffer_size=4096):
+    self.paths = sorted(paths)
+    self.team_name = team_name
+    self.shuffle = shuffle
+    self.buffer_size = buffer_size
+
+  def samples(self, paths):
+    for path in paths:
+      obses, samples = load_episode(path, self.team_name)
+      for obs_id, unit_id, action in samples:
+        yield obses[obs_id], unit_id, action
+
+  def __iter__(self):
+    info = get_worker_info()
+    if info is None:
+      # Drawn from torch's RNG, so seed_everything fixes the sequence of epochs
+      seed, worker, workers = int(torch.randint(2 ** 31, ())), 0, 1
+    else:
+      seed, worker, workers = info.seed - info.id, info.id, info.num_workers
+
+    # Every worker of every process gets its own shard
+    worker += distributed.rank() * workers
+    workers *= distributed.world_size()
+
+    paths = self.paths
+    if self.shuffle:
+      paths = [paths[i] for i in np.random.default_rng(seed).permutation(len(paths))]
+    samples = self.samples(paths[worker::workers])
+    if not self.shuffle:
+      for obs, unit_id, action in samples:
+        yield make_input(obs, unit_id), action
+      return
+
+    rng = random.Random(seed + worker)
+    buffer = []
+    for sample in samples:
+      if len(buffer) < self.buffer_size:
+        buffer.append(sample)
+        continue
+      i = rng.randrange(self.buffer_size)
+      (obs, unit_id, action), buffer[i] = buffer[i], sample
+      yield make_input(obs, unit_id), action
+    rng.shuffle(buffer)
+    for obs, unit_id, action in buffer:
+      yield make_input(obs, unit_id), action
 
 # Neural Network for Lux AI
 class BasicConv2d(nn.Module):
@@ -197,12 +209,70 @@ class LuxNet(nn.Module):
     p = self.head_p(h_head)
     return p
 
-def train_model(model, dataloaders_dict, criterion, optimizer, num_epochs):
-  best_acc = 0.0
+def get_device(device=None):
+  return torch.device(device or ('cuda' if torch.cuda.is_available() else 'cpu'))
 
-  for epoch in range(num_epochs):
-    model.cuda()
-    
+def prepare_model(model, device, channels_last=False, compile=False):
+  """
+  Moves model to device, in channels_last memory format if asked, and
+  returns what to call for the training forward pass: model itself, or
+  wrappers sharing its parameters, DistributedDataParallel inside a process
+  group and torch.compile if asked
+  """
+  model.to(device, memory_format=torch.channels_last if channels_last else torch.contiguous_format)
+  model = distributed.wrap(model)
+  return torch.compile(model) if compile else model
+
+def to_device(item, device, channels_last=False):
+  states = item[0].to(device, non_blocking=True).float()
+  if channels_last:
+    states = states.contiguous(memory_format=torch.channels_last)
+  return states, item[1].to(device, non_blocking=True).long()
+
+def save_inference_models(model, crop_border=None):
+  # Written to temporary files renamed over the models, like checkpoint.save_atomic,
+  # so a run killed mid-write keeps the previous best models intact
+  traced = torch.jit.trace(model, torch.rand(1, 20, 32, 32))
+  extra_files = {} if crop_border is None else {'crop_border': str(crop_border)}
+  traced.save('model.pth.tmp', _extra_files=extra_files)
+  os.replace('model.pth.tmp', 'model.pth')
+  # np.savez appends .npz to names without it
+  save_npz(model, 'model.tmp.npz', crop_border)
+  os.replace('model.tmp.npz', 'model.npz')
+
+def export_model(model, writer=None, crop_border=None):
+  """
+  Saves the TorchScript and NumPy inference models from a CPU copy of model,
+  leaving the training copy where it is. With a CheckpointWriter the copy is
+  traced and saved in the background. A model trained on maps cropped by
+  batching.crop_to_map records its crop_border, inference has to match it.
+  """
+  model = copy.deepcopy(model).cpu().to(memory_format=torch.contiguous_format)
+  if writer is None:
+    save_inference_models(model, crop_border)
+  else:
+    writer.submit(save_inference_models, model, crop_border)
+
+def train_model(
+  model, dataloaders_dict, criterion, optimizer, num_epochs,
+  device=None, channels_last=False, bf16=False, compile=False,
+  start_epoch=0, best_acc=0.0, writer=None, on_epoch_end=None, log=None, crop_border=None
+):
+  """
+  Trains for epochs start_epoch to num_epochs, exporting the model whenever
+  validation accuracy beats best_acc. on_epoch_end(epochs_done, best_acc) is
+  called after every epoch. Per-epoch throughput and timings go to log, a
+  telemetry.TrainingLog. crop_border is recorded with the exported models.
+  Returns the best accuracy.
+
+  In a process group each process trains on its shard, losses and accuracies
+  are summed over all of them, and only rank 0 exports, prints and logs.
+  """
+  device = get_device(device)
+  forward = prepare_model(model, device, channels_last, compile)
+
+  for epoch in range(start_epoch, num_epochs):
+    record = {'epoch': epoch + 1, 'epochs': num_epochs, 'lr': optimizer.param_groups[0]['lr']}
     for phase in ['train', 'val']:
       if phase == 'train':
         model.train()
@@ -211,78 +281,278 @@ def train_model(model, dataloaders_dict, criterion, optimizer, num_epochs):
           
       epoch_loss = 0.0
       epoch_acc = 0
+      data_size = 0
       
       dataloader = dataloaders_dict[phase]
-      for item in tqdm(dataloader, leave=False):
-        states = item[0].cuda().float()
-        actions = item[1].cuda().long()
+      timer = PassTimer()
+      # Validation runs the bare model, it needs no gradient sync
+      with distributed.join(getattr(forward, '_orig_mod', forward)) if phase == 'train' else contextlib.nullcontext():
+        for item in timer.batches(tqdm(dataloader, leave=False, disable=not distributed.is_main())):
+          states, actions = to_device(item, device, channels_last)
 
-        optimizer.zero_grad()
-        
-        with torch.set_grad_enabled(phase == 'train'):
-          policy = model(states)
-          loss = criterion(policy, actions)
-          _, preds = torch.max(policy, 1)
+          optimizer.zero_grad()
+          
+          with torch.set_grad_enabled(phase == 'train'):
+            with torch.autocast(device.type, dtype=torch.bfloat16, enabled=bf16):
+              policy = (forward if phase == 'train' else model)(states)
+              loss = criterion(policy, actions)
+            _, preds = torch.max(policy, 1)
 
-          if phase == 'train':
-            loss.backward()
-            optimizer.step()
+            if phase == 'train':
+              loss.backward()
+              optimizer.step()
 
-          epoch_loss += loss.item() * len(policy)
-          epoch_acc += torch.sum(preds == actions.data)
+            epoch_loss += loss.item() * len(policy)
+            epoch_acc += torch.sum(preds == actions.data).item()
+            data_size += len(policy)
 
-      data_size = len(dataloader.dataset)
+      epoch_loss, epoch_acc, data_size = distributed.all_reduce_sum([epoch_loss, epoch_acc, data_size])
       epoch_loss = epoch_loss / data_size
-      epoch_acc = epoch_acc.double() / data_size
+      epoch_acc = epoch_acc / data_size
+      timer.samples = int(data_size)
+      record[phase] = {**timer.summary(), 'loss': epoch_loss, 'acc': epoch_acc}
+      if not distributed.is_main():
+        continue
+
+      print(
+        f'Epoch {epoch + 1}/{num_epochs} | {phase:^5} | Loss: {epoch_loss:.4f} | Acc: {epoch_acc:.4f} | '
+        f'{record[phase]["samples_per_sec"]:.0f} samples/s, {record[phase]["data_wait"]:.1f}s waiting on data'
+      )
+    if log is not None:
+      log.write(record)
 
-      print(f'Epoch {epoch + 1}/{num_epochs} | {phase:^5} | Loss: {epoch_loss:.4f} | Acc: {epoch_acc:.4f}')
-    
     if epoch_acc > best_acc:
-        traced = torch.jit.trace(model.cpu(), torch.rand(1, 20, 32, 32))
-        traced.save('model.pth')
+        if distributed.is_main():
+          export_model(model, writer, crop_border)
         best_acc = epoch_acc
+    if on_epoch_end is not None:
+      on_epoch_end(epoch + 1, best_acc)
 
-def run():
+  return best_acc
+
+# A fresh AdamW per phase: (learning rate, epochs)
+LR_SCHEDULE = [(1e-3, 5), (1e-4, 5), (1e-5, 2)]
+
+def print_labels(labels):
+  actions = ['north', 'south', 'west', 'east', 'bcity']
+  for value, count in zip(*np.unique(labels, return_counts=True)):
+    print(f'{actions[value]:^5}: {count:>3}')
+
+def make_datasets(
+  episode_dir, cache_dir=None, processes=1, stream=False, buffer_size=4096, team_name='Toad Brigade', index_path=None
+):
+  """
+  Train and validation datasets of team_name's wins, from episode_dir
+  directly, from its preprocessed cache in cache_dir, or streamed from disk
+  with stream. The episode index lives at index_path, by default in
+  cache_dir when there is one and otherwise in episode_dir.
+  """
+  index_path = index_path or index_location(episode_dir, cache_dir)
+  if stream:
+    # Split by episode, a stratified per-sample split needs every label up front
+    episodes = select_episodes(episode_dir, team_name, processes, index_path)
+    print('episodes:', len(episodes))
+    train, val = train_test_split(episodes, test_size=0.1, random_state=42)
+    return (
+      StreamingLuxDataset(train, team_name, buffer_size=buffer_size),
+      StreamingLuxDataset(val, team_name, shuffle=False)
+    )
+
+  if cache_dir is not None:
+    # Each episode is encoded once into memory-mapped planes, new episodes are added as they come
+    paths = preprocess(episode_dir, cache_dir, team_name, processes, index_path)
+    dataset = CachedLuxDataset(paths)
+    print('obses:', len(dataset.observations), 'samples:', len(dataset))
+    labels = dataset.labels
+    print_labels(labels)
+    train, val = train_test_split(np.arange(len(labels)), test_size=0.1, random_state=42, stratify=labels)
+    return CachedLuxDataset(paths, train), CachedLuxDataset(paths, val)
+
+  obses, samples = create_dataset_from_json(episode_dir, team_name, processes, index_path)
+  print('obses:', len(obses), 'samples:', len(samples))
+  labels = [sample[-1] for sample in samples]
+  print_labels(labels)
+  train, val = train_test_split(samples, test_size=0.1, random_state=42, stratify=labels)
+  return LuxDataset(obses, train), LuxDataset(obses, val)
+
+def run(
+  episode_dir='../lux-ai-top-episodes', cache_dir=None, processes=1, stream=False, buffer_size=4096, augment=False,
+  workers=0, pin_memory=False, persistent_workers=False, prefetch_factor=2, group_observations=False,
+  device=None, threads=None, channels_last=False, bf16=False, compile=False,
+  checkpoint_path='checkpoint.pt', resume=False, world_size=1, team_name='Toad Brigade', crop_border=None,
+  index_path=None
+):
+  """
+  Builds the datasets once, then trains in world_size data-parallel
+  processes, which share the datasets rather than loading them again
+  """
   print("Begin")
   torch.multiprocessing.freeze_support()
 
   seed = 42
   seed_everything(seed)
 
-  episode_dir = '../lux-ai-top-episodes'
-  obses, samples = create_dataset_from_json(episode_dir)
-  print('obses:', len(obses), 'samples:', len(samples))
+  train_dataset, val_dataset = make_datasets(episode_dir, cache_dir, processes, stream, buffer_size, team_name, index_path)
+  if group_observations and not isinstance(train_dataset, LuxDataset):
+    raise ValueError('group_observations needs the in-memory dataset, not --cache or --stream')
+  if crop_border is not None and stream:
+    raise ValueError('crop_border needs the map sizes of the whole dataset, not --stream')
+  settings = dict(
+    stream=stream, augment=augment, workers=workers, pin_memory=pin_memory,
+    persistent_workers=persistent_workers, prefetch_factor=prefetch_factor, group_observations=group_observations,
+    device=device, threads=threads, channels_last=channels_last, bf16=bf16, compile=compile,
+    checkpoint_path=checkpoint_path, resume=resume, crop_border=crop_border
+  )
+  distributed.launch(fit, world_size, train_dataset, val_dataset, settings)
 
-  labels = [sample[-1] for sample in samples]
-  actions = ['north', 'south', 'west', 'east', 'bcity']
-  for value, count in zip(*np.unique(labels, return_counts=True)):
-    print(f'{actions[value]:^5}: {count:>3}')
+def fit(rank, world_size, train_dataset, val_dataset, settings):
+  """
+  Runs LR_SCHEDULE as process rank of world_size, all of it when world_size is 1
+  """
+  stream, augment, group_observations = settings['stream'], settings['augment'], settings['group_observations']
+  device, threads, resume = settings['device'], settings['threads'], settings['resume']
+  checkpoint_path, crop_border = settings['checkpoint_path'], settings['crop_border']
+
+  # Same seed everywhere, so every process draws the same shuffles and takes its share
+  seed_everything(42)
+  if threads or world_size > 1:
+    torch.set_num_threads(threads or max(1, os.cpu_count() // world_size))
 
   model = LuxNet()
-  train, val = train_test_split(samples, test_size=0.1, random_state=42, stratify=labels)
   batch_size = 64
-  train_loader = DataLoader(
-    LuxDataset(obses, train), 
-    batch_size=batch_size, 
-    shuffle=True, 
-    num_workers=0
-  )
-  val_loader = DataLoader(
-    LuxDataset(obses, val), 
-    batch_size=batch_size, 
-    shuffle=False, 
-    num_workers=0
-  )
+  sharded = world_size > 1 and not stream
+  loader_options = dict(num_workers=settings['workers'], pin_memory=settings['pin_memory'])
+  if settings['workers'] > 0:
+    loader_options.update(persistent_workers=settings['persistent_workers'], prefetch_factor=settings['prefetch_factor'])
+  # Cropped to the map: batches of one map size each, so a 12x12 map runs
+  # on 12x12 plus the border instead of the whole 32x32 canvas
+  cropped = crop_border is not None
+  train_sizes = train_dataset.map_sizes if cropped else None
+  val_sizes = val_dataset.map_sizes if cropped else None
+  if group_observations:
+    # Batches of whole observations, each encoded once
+    train_collate = ObservationCollate(train_dataset)
+    val_collate = ObservationCollate(val_dataset)
+    if cropped:
+      train_collate, val_collate = CropCollate(crop_border, train_collate), CropCollate(crop_border, val_collate)
+    train_loader = DataLoader(
+      range(len(train_dataset)),
+      batch_sampler=ObservationBatchSampler(train_dataset.samples['obs'], batch_size, sizes=train_sizes),
+      collate_fn=AugmentCollate(train_collate) if augment else train_collate,
+      **loader_options
+    )
+    val_loader = DataLoader(
+      range(len(val_dataset)),
+      batch_sampler=ObservationBatchSampler(val_dataset.samples['obs'], batch_size, shuffle=False, sizes=val_sizes),
+      collate_fn=val_collate,
+      **loader_options
+    )
+  elif cropped:
+    train_collate = CropCollate(crop_border)
+    train_loader = DataLoader(
+      train_dataset,
+      batch_sampler=MapSizeBatchSampler(train_sizes, batch_size),
+      collate_fn=AugmentCollate(train_collate) if augment else train_collate,
+      **loader_options
+    )
+    val_loader = DataLoader(
+      val_dataset,
+      batch_sampler=MapSizeBatchSampler(val_sizes, batch_size, shuffle=False),
+      collate_fn=CropCollate(crop_border),
+      **loader_options
+    )
+  else:
+    train_loader = DataLoader(
+      train_dataset, 
+      batch_size=batch_size, 
+      shuffle=not stream and not sharded, 
+      sampler=ShardSampler(len(train_dataset)) if sharded else None,
+      collate_fn=AugmentCollate() if augment else None,
+      **loader_options
+    )
+    val_loader = DataLoader(
+      val_dataset, 
+      batch_size=batch_size, 
+      shuffle=False, 
+      sampler=ShardSampler(len(val_dataset), shuffle=False) if sharded else None,
+      **loader_options
+    )
   dataloaders_dict = {"train": train_loader, "val": val_loader}
   criterion = nn.CrossEntropyLoss()
-  optimizer = torch.optim.AdamW(model.parameters(), lr=1e-3)
+  options = dict(device=device, channels_last=settings['channels_last'], bf16=settings['bf16'], compile=settings['compile'])
 
-  optimizer = torch.optim.AdamW(model.parameters(), lr=1e-3)
-  train_model(model, dataloaders_dict, criterion, optimizer, num_epochs=5)
-  optimizer = torch.optim.AdamW(model.parameters(), lr=1e-4)
-  train_model(model, dataloaders_dict, criterion, optimizer, num_epochs=5)
-  optimizer = torch.optim.AdamW(model.parameters(), lr=1e-5)
-  train_model(model, dataloaders_dict, criterion, optimizer, num_epochs=2)
+  start = {'phase': 0, 'epoch': 0, 'best_acc': 0.0}
+  if resume:
+    start = checkpoint.load(checkpoint_path)
+    model.load_state_dict(start['model'])
+    # Optimizer state loads onto the device its parameters are on
+    model.to(get_device(device))
+    checkpoint.set_rng_state(start['rng'])
+    if rank == 0:
+      print(f"Resuming phase {start['phase'] + 1}/{len(LR_SCHEDULE)} after epoch {start['epoch']}")
+
+  # Only rank 0 writes checkpoints, models and telemetry
+  writer = checkpoint.CheckpointWriter() if rank == 0 else None
+  log = TrainingLog(f'{os.path.splitext(checkpoint_path)[0]}.telemetry.jsonl') if rank == 0 else None
+  for phase, (lr, num_epochs) in enumerate(LR_SCHEDULE):
+    if phase < start['phase']:
+      continue
+    optimizer = torch.optim.AdamW(model.parameters(), lr=lr)
+    resuming = resume and phase == start['phase']
+    if resuming:
+      optimizer.load_state_dict(start['optimizer'])
+
+    def save(epoch, best_acc):
+      writer.save({
+        'model': model.state_dict(),
+        'optimizer': optimizer.state_dict(),
+        'phase': phase,
+        'epoch': epoch,
+        'best_acc': best_acc,
+        'rng': checkpoint.rng_state(),
+      }, checkpoint_path)
+
+    train_model(
+      model, dataloaders_dict, criterion, optimizer, num_epochs,
+      start_epoch=start['epoch'] if resuming else 0,
+      best_acc=start['best_acc'] if resuming else 0.0,
+      writer=writer, on_epoch_end=save if rank == 0 else None, log=log, crop_border=crop_border, **options
+    )
+  if writer is not None:
+    writer.close()
 
 if __name__ == '__main__':
-  run()
\ No newline at end of file
+  parser = argparse.ArgumentParser(description='Imitation learning on top-agent episodes')
+  parser.add_argument('--episodes', default='../lux-ai-top-episodes', help='directory of episode JSON files')
+  parser.add_argument('--team', default='Toad Brigade', help='imitate the winning episodes of this team')
+  parser.add_argument('--cache', help='directory for the preprocessed, memory-mapped dataset of --episodes, stale entries in it are deleted')
+  parser.add_argument('--index', help='episode index file, by default in --cache when given, otherwise in --episodes')
+  parser.add_argument('--ingest-processes', type=int, default=1, help='processes parsing episode files, 0 for one per core')
+  parser.add_argument('--stream', action='store_true', help='read episodes from disk during training instead of loading them up front')
+  parser.add_argument('--shuffle-buffer', type=int, default=4096, help='samples held for shuffling with --stream')
+  parser.add_argument('--augment', action='store_true', help='train on randomly rotated and flipped batches')
+  parser.add_argument('--workers', type=int, default=0, help='DataLoader worker processes')
+  parser.add_argument('--pin-memory', action='store_true', help='collate batches into pinned memory')
+  parser.add_argument('--persistent-workers', action='store_true', help='keep DataLoader workers alive between epochs')
+  parser.add_argument('--prefetch-factor', type=int, default=2, help='batches each worker loads ahead')
+  parser.add_argument('--group-observations', action='store_true', help='batch the samples of each observation together and encode it once')
+  parser.add_argument('--crop-border', type=int, help='train on maps cropped to the map plus this many cells per side, batched by map size')
+  parser.add_argument('--device', help='torch device, cuda when available otherwise cpu')
+  parser.add_argument('--threads', type=int, help='intra-op threads for torch')
+  parser.add_argument('--channels-last', action='store_true', help='NHWC activations, faster convolutions on most CPUs')
+  parser.add_argument('--bf16', action='store_true', help='bfloat16 autocast for the forward pass')
+  parser.add_argument('--compile', action='store_true', help='torch.compile the model')
+  parser.add_argument('--checkpoint', default='checkpoint.pt', help='full training state, written after every epoch, with per-epoch telemetry in <name>.telemetry.jsonl')
+  parser.add_argument('--resume', action='store_true', help='continue from --checkpoint')
+  parser.add_argument('--ddp', type=int, default=1, help='local data-parallel training processes (gloo)')
+  args = parser.parse_args()
+  run(
+    episode_dir=args.episodes, cache_dir=args.cache, processes=args.ingest_processes or None,
+    stream=args.stream, buffer_size=args.shuffle_buffer, augment=args.augment,
+    workers=args.workers, pin_memory=args.pin_memory,
+    persistent_workers=args.persistent_workers, prefetch_factor=args.prefetch_factor,
+    group_observations=args.group_observations, crop_border=args.crop_border,
+    device=args.device, threads=args.threads, channels_last=args.channels_last, bf16=args.bf16, compile=args.compile,
+    checkpoint_path=args.checkpoint, resume=args.resume, world_size=args.ddp,
+    team_name=args.team, index_path=args.index
+  )
@@ -0,0 +1,46 @@
+import numpy as np
+
+unit_actions = [('move', 'n'), ('move', 's'), ('move', 'w'), ('move', 'e'), ('build_city',)]
+# Where each action leaves the unit, as (dx, dy)
+action_offsets = np.array([(0, -1), (0, 1), (-1, 0), (1, 0), (0, 0)])
+
+
+def call_func(obj, method, args=[]):
+  return getattr(obj, method)(*args)
+
+
+def get_actions(policies, units, game_map, team):
+  """
+  Decodes a (units x 5) policy matrix into one action per unit. Each unit takes
+  its best action that stays on the map and doesn't end on a cell already
+  claimed this turn, unless that cell is one of our city tiles.
+  """
+  if len(units) == 0:
+    return []
+
+  labels = np.argsort(policies, axis=1)[:, ::-1]
+  unit_x = np.array([unit.pos.x for unit in units])
+  unit_y = np.array([unit.pos.y for unit in units])
+  xs = unit_x[:, None] + action_offsets[labels, 0]
+  ys = unit_y[:, None] + action_offsets[labels, 1]
+
+  on_map = (xs >= 0) & (xs < game_map.width) & (ys >= 0) & (ys < game_map.height)
+  xs = np.where(on_map, xs, 0)
+  ys = np.where(on_map, ys, 0)
+  in_city = on_map & game_map.citytile_mask(team)[ys, xs]
+
+  # Cells claimed by the units decoded so far
+  occupied = np.zeros((game_map.height, game_map.width), dtype=bool)
+  actions = []
+  rows = zip(units, labels.tolist(), xs.tolist(), ys.tolist(), on_map.tolist(), in_city.tolist())
+  for unit, unit_labels, unit_xs, unit_ys, unit_on_map, unit_in_city in rows:
+    for label, x, y, valid, city in zip(unit_labels, unit_xs, unit_ys, unit_on_map, unit_in_city):
+      if valid and (city or not occupied[y, x]):
+        actions.append(call_func(unit, *unit_actions[label]))
+        break
+    else:
+      x, y = unit.pos.x, unit.pos.y
+      actions.append(unit.move('c'))
+    occupied[y, x] = True
+
+  return actions
@@ -0,0 +1,119 @@
+import numpy as np
+from packed import PackedObservation, RESOURCE_TYPES
+
+RESOURCE_CHANNELS = {name: 12 + i for i, name in enumerate(RESOURCE_TYPES)}
+# Bump whenever the encoded planes change, it invalidates preprocessed datasets
+ENCODER_VERSION = 1
+
+
+class ObservationEncoder:
+  """
+  Builds the feature planes that are shared by every unit (channels 2-19) from
+  a PackedObservation, packing raw observations first. Per-unit inputs are
+  then produced by overlaying the unit channels (0-1) on a copy of the shared
+  planes.
+  """
+  def __init__(self, obs, player_id=None):
+    if not isinstance(obs, PackedObservation):
+      obs = PackedObservation(obs)
+    if player_id is None:
+      player_id = obs.player
+    self.x_shift = x_shift = (32 - obs.width) // 2
+    self.y_shift = y_shift = (32 - obs.height) // 2
+
+    b = np.zeros((20, 32, 32), dtype=np.float32)
+
+    # Units; several units may share a city tile, in which case the last one wins
+    units = obs.units
+    self.obs = obs
+    self._unit_ids = None
+    self.unit_x = units['x'].astype(np.intp) + x_shift
+    self.unit_y = units['y'].astype(np.intp) + y_shift
+    self.unit_channel = 2 + (units['team'].astype(np.intp) - player_id) % 2 * 3
+    cooldown = (units['cooldown'] / 6).astype(np.float32)
+    self.unit_cargo = (units['cargo'] / 100).astype(np.float32)
+    self.unit_under = np.zeros((len(units), 3), dtype=np.float32)
+
+    stacks = {}
+    for i, key in enumerate(zip(self.unit_x, self.unit_y, self.unit_channel)):
+      stacks.setdefault(key, []).append(i)
+    for stack in stacks.values():
+      if len(stack) > 1:
+        # What the cell shows once a unit is lifted off it
+        top, below = stack[-1], stack[-2]
+        self.unit_under[stack[:-1]] = (1, cooldown[top], self.unit_cargo[top])
+        self.unit_under[top] = (1, cooldown[below], self.unit_cargo[below])
+
+    if len(units):
+      top = np.array([stack[-1] for stack in stacks.values()], dtype=np.intp)
+      c = self.unit_channel[top, None] + np.arange(3)
+      b[c, self.unit_x[top, None], self.unit_y[top, None]] = np.stack([
+        np.ones(len(top), dtype=np.float32), cooldown[top], self.unit_cargo[top]
+      ], axis=1)
+
+    # CityTiles
+    tiles = obs.citytiles
+    if len(tiles):
+      cities = obs.cities[tiles['city']]
+      x, y = tiles['x'].astype(np.intp) + x_shift, tiles['y'].astype(np.intp) + y_shift
+      c = 8 + (tiles['team'].astype(np.intp) - player_id) % 2 * 2
+      b[c, x, y] = 1
+      b[c + 1, x, y] = np.minimum(cities['fuel'].astype(np.float64) / cities['light_upkeep'], 10) / 10
+
+    # Resources
+    resources = obs.resources
+    if len(resources):
+      x, y = resources['x'].astype(np.intp) + x_shift, resources['y'].astype(np.intp) + y_shift
+      b[12 + resources['type'].astype(np.intp), x, y] = resources['amount'] / 800
+
+    # Research Points
+    for team, rp in enumerate(obs.research):
+      b[15 + (team - player_id) % 2, :] = rp / 200
+
+    # Day/Night Cycle
+    b[17, :] = obs.step % 40 / 40
+    # Turns
+    b[18, :] = obs.step / 360
+    # Map Size
+    b[19, x_shift:32 - x_shift, y_shift:32 - y_shift] = 1
+
+    self.base = b
+
+  @property
+  def unit_ids(self):
+    """
+    Unit id -> row of the observation's units table
+    """
+    if self._unit_ids is None:
+      self._unit_ids = dict(zip(self.obs.unit_names(), range(len(self.obs.units))))
+    return self._unit_ids
+
+  def make_input(self, unit_id):
+    return self.make_inputs([unit_id])[0]
+
+  def make_inputs(self, unit_ids):
+    """
+    Returns a (len(unit_ids), 20, 32, 32) batch, one input per unit
+    """
+    idx = np.array([self.unit_ids.get(unit_id, -1) for unit_id in unit_ids], dtype=np.intp)
+    b = np.repeat(self.base[None], len(idx), axis=0)
+
+    # Units missing from the observation get the shared planes only
+    rows = np.flatnonzero(idx >= 0)
+    idx = idx[rows]
+    overlay_units(
+      b, rows, self.unit_x[idx], self.unit_y[idx],
+      self.unit_channel[idx], self.unit_cargo[idx], self.unit_under[idx]
+    )
+    return b
+
+
+def overlay_units(b, rows, x, y, channel, cargo, under):
+  """
+  Turns rows of a batch of shared planes into per-unit inputs: the unit moves
+  from its team's unit channels (which get back what lies under it) into the
+  Position and Cargo channels
+  """
+  b[rows[:, None], channel[:, None] + np.arange(3), x[:, None], y[:, None]] = under
+  b[rows, 0, x, y] = 1
+  b[rows, 1, x, y] = cargo
@@ -4,89 +4,25 @@ import neat
 import visualize
 import numpy as np
 from lux.game import Game
+from encoder import ObservationEncoder
+from decoder import get_actions
+from turn_timer import TurnTimer
 from kaggle_environments import make
 from functools import partial
 from typing import Dict
 
-def make_input(obs, player_id, unit_id):
-  width, height = obs.width, obs.height
-  x_shift = (32 - width) // 2
-  y_shift = (32 - height) // 2
-  cities = {}
-  
-  b = np.zeros((20, 32, 32), dtype=np.float32)
-  
-  for update in obs['updates']:
-    strs = update.split(' ')
-    input_identifier = strs[0]
-    
-    if input_identifier == 'u':
-      x = int(strs[4]) + x_shift
-      y = int(strs[5]) + y_shift
-      wood = int(strs[7])
-      coal = int(strs[8])
-      uranium = int(strs[9])
-      if unit_id == strs[3]:
-        # Position and Cargo
-        b[:2, x, y] = (
-          1,
-          (wood + coal + uranium) / 100
-        )
-      else:
-        # Units
-        team = int(strs[2])
-        cooldown = float(strs[6])
-        idx = 2 + (team - player_id) % 2 * 3
-        b[idx:idx + 3, x, y] = (
-          1,
-          cooldown / 6,
-          (wood + coal + uranium) / 100
-        )
-    elif input_identifier == 'ct':
-      # CityTiles
-      team = int(strs[1])
-      city_id = strs[2]
-      x = int(strs[3]) + x_shift
-      y = int(strs[4]) + y_shift
-      idx = 8 + (team - player_id) % 2 * 2
-      b[idx:idx + 2, x, y] = (
-        1,
-        cities[city_id]
-      )
-    elif input_identifier == 'r':
-      # Resources
-      r_type = strs[1]
-      x = int(strs[2]) + x_shift
-      y = int(strs[3]) + y_shift
-      amt = int(float(strs[4]))
-      b[{'wood': 12, 'coal': 13, 'uranium': 14}[r_type], x, y] = amt / 800
-    elif input_identifier == 'rp':
-      # Research Points
-      team = int(strs[1])
-      rp = int(strs[2])
-      b[15 + (team - player_id) % 2, :] = min(rp, 200) / 200
-    elif input_identifier == 'c':
-      # Cities
-      city_id = strs[2]
-      fuel = float(strs[3])
-      lightupkeep = float(strs[4])
-      cities[city_id] = min(fuel / lightupkeep, 10) / 10
-  
-  # Day/Night Cycle
-  b[17, :] = obs['step'] % 40 / 40
-  # Turns
-  b[18, :] = obs['step'] / 360
-  # Map Size
-  b[19, x_shift:32 - x_shift, y_shift:32 - y_shift] = 1
+# Set LUX_TURN_TIMINGS=timings.json (or .csv) to record where turn time goes
+timer = TurnTimer(os.environ.get('LUX_TURN_TIMINGS'))
 
-  return b.flatten()
+def make_input(obs, player_id, unit_id):
+  return ObservationEncoder(obs, player_id).make_input(unit_id).flatten()
 
 game_state = None
 def get_game_state(observation, player_id):
   global game_state
   
   if observation["step"] == 0:
-    game_state = Game()
+    game_state = Game(incremental=True)
     game_state._initialize(observation["updates"])
     game_state._update(observation["updates"][2:])
     game_state.id = player_id
@@ -94,30 +30,21 @@ def get_game_state(observation, player_id):
     game_state._update(observation["updates"])
   return game_state
 
-def in_city(pos):  
-  try:
-    city = game_state.map.get_cell_by_pos(pos).citytile
-    return city is not None and city.team == game_state.id
-  except:
+def in_city(pos):
+  if not (0 <= pos.x < game_state.map_width and 0 <= pos.y < game_state.map_height):
     return False
-
-def call_func(obj, method, args=[]):
-  return getattr(obj, method)(*args)
-
-unit_actions = [('move', 'n'), ('move', 's'), ('move', 'w'), ('move', 'e'), ('build_city',)]
-def get_action(policy, unit, dest):
-  for label in np.argsort(policy)[::-1]:
-    act = unit_actions[label]
-    pos = unit.pos.translate(act[-1], 1) or unit.pos
-    if pos not in dest or in_city(pos):
-      return call_func(unit, *act), pos 
-      
-  return unit.move('c'), unit.pos
+  city = game_state.map.get_cell_by_pos(pos).citytile
+  return city is not None and city.team == game_state.id
 
 def neatAgent(nn: neat.nn, player_id, observation):
+  with timer.turn(observation['step']):
+    return neatTurn(nn, player_id, observation)
+
+def neatTurn(nn: neat.nn, player_id, observation):
   global game_state
   
-  game_state = get_game_state(observation, player_id)  
+  with timer.phase('parse'):
+    game_state = get_game_state(observation, player_id)
   player = game_state.players[player_id]
   actions = []
   
@@ -134,16 +61,21 @@ def neatAgent(nn: neat.nn, player_id, observation):
           player.research_points += 1
   
   # Worker Actions
-  dest = []
-  for unit in player.units:
-    if unit.can_act() and (game_state.turn % 40 < 30 or not in_city(unit.pos)) and hasattr(observation, 'width'):
-      state = make_input(observation, player_id, unit.id)
-      p = nn.activate(state)
-
-      action, pos = get_action(p, unit, dest)
-      actions.append(action)
-      dest.append(pos)
-
+  units = [
+    unit for unit in player.units
+    if unit.can_act() and (game_state.turn % 40 < 30 or not in_city(unit.pos)) and hasattr(observation, 'width')
+  ]
+  if not units:
+    return actions
+
+  with timer.phase('encode'):
+    encoder = ObservationEncoder(observation, player_id)
+    states = encoder.make_inputs([unit.id for unit in units])
+  with timer.phase('inference'):
+    policies = np.array([nn.activate(state.flatten()) for state in states])
+
+  with timer.phase('decode'):
+    actions += get_actions(policies, units, game_state.map, game_state.id)
   return actions
 
 # class Observation(Dict[str, any]):
@@ -167,6 +99,7 @@ def luxMatch(agent0, agent1):
     env.step([agent0_actions, agent1_actions])
 
   # env.run([])
+  timer.dump()
   replay = env.toJSON()
   # print("REPLAYYYYY")
   # print(replay)
@@ -1,56 +1,197 @@
 import math
 from typing import List
 
+import numpy as np
+
 from .constants import Constants
 
 DIRECTIONS = Constants.DIRECTIONS
 RESOURCE_TYPES = Constants.RESOURCE_TYPES
 
+RESOURCE_CODES = {RESOURCE_TYPES.WOOD: 1, RESOURCE_TYPES.COAL: 2, RESOURCE_TYPES.URANIUM: 3}
+RESOURCE_NAMES = [None, RESOURCE_TYPES.WOOD, RESOURCE_TYPES.COAL, RESOURCE_TYPES.URANIUM]
+
 
 class Resource:
+    """
+    a resource, or a view onto the resource of one GameMap position when handed out by a Cell
+    """
     def __init__(self, r_type: str, amount: int):
-        self.type = r_type
-        self.amount = amount
+        self._map = None
+        self._type = r_type
+        self._amount = amount
+
+    @classmethod
+    def _view(cls, game_map: 'GameMap', x, y) -> 'Resource':
+        resource = cls.__new__(cls)
+        resource._map = game_map
+        resource._x = x
+        resource._y = y
+        return resource
+
+    @property
+    def type(self) -> str:
+        if self._map is None:
+            return self._type
+        return RESOURCE_NAMES[self._map.resource_type[self._y, self._x]]
+
+    @type.setter
+    def type(self, r_type: str):
+        if self._map is None:
+            self._type = r_type
+        else:
+            self._map.resource_type[self._y, self._x] = RESOURCE_CODES[r_type]
+
+    @property
+    def amount(self) -> int:
+        if self._map is None:
+            return self._amount
+        return int(self._map.resource_amount[self._y, self._x])
+
+    @amount.setter
+    def amount(self, amount: int):
+        if self._map is None:
+            self._amount = amount
+        else:
+            self._map.resource_amount[self._y, self._x] = amount
 
 
 class Cell:
-    def __init__(self, x, y):
-        self.pos = Position(x, y)
-        self.resource: Resource = None
-        self.citytile = None
-        self.road = 0
+    """
+    view onto one position of the GameMap arrays, created on first access
+    """
+    def __init__(self, x, y, game_map: 'GameMap'):
+        self.pos = game_map.position(x, y)
+        self._map = game_map
+        self._resource = None
+
+    @property
+    def resource(self) -> Resource:
+        """
+        a view onto the resource on this cell, writes to its type and amount change the map
+        """
+        if self._map.resource_type[self.pos.y, self.pos.x] == 0:
+            return None
+        if self._resource is None:
+            self._resource = Resource._view(self._map, self.pos.x, self.pos.y)
+        return self._resource
+
+    @resource.setter
+    def resource(self, resource: Resource):
+        if resource is None:
+            self._map._setResource(None, self.pos.x, self.pos.y, 0)
+        else:
+            self._map._setResource(resource.type, self.pos.x, self.pos.y, resource.amount)
+
+    @property
+    def citytile(self):
+        return self._map._citytiles.get((self.pos.x, self.pos.y))
+
+    @citytile.setter
+    def citytile(self, citytile):
+        key = (self.pos.x, self.pos.y)
+        if citytile is None:
+            self._map._citytiles.pop(key, None)
+            self._map.citytile_team[self.pos.y, self.pos.x] = -1
+        else:
+            self._map._citytiles[key] = citytile
+            self._map.citytile_team[self.pos.y, self.pos.x] = citytile.team
+
+    @property
+    def road(self) -> float:
+        return float(self._map.road[self.pos.y, self.pos.x])
+
+    @road.setter
+    def road(self, road: float):
+        self._map.road[self.pos.y, self.pos.x] = road
+
     def has_resource(self):
-        return self.resource is not None and self.resource.amount > 0
+        return bool(self._map.resource_type[self.pos.y, self.pos.x] != 0 and self._map.resource_amount[self.pos.y, self.pos.x] > 0)
 
 
 class GameMap:
+    """
+    struct-of-arrays map, every grid is indexed [y, x]
+    """
     def __init__(self, width, height):
         self.height = height
         self.width = width
-        self.map: List[List[Cell]] = [None] * height
-        for y in range(0, self.height):
-            self.map[y] = [None] * width
-            for x in range(0, self.width):
-                self.map[y][x] = Cell(x, y)
+        self.resource_type = np.zeros((height, width), dtype=np.int8)
+        self.resource_amount = np.zeros((height, width), dtype=np.int32)
+        self.road = np.zeros((height, width), dtype=np.float64)
+        self.citytile_team = np.full((height, width), -1, dtype=np.int8)
+        self._citytiles = {}
+        self._cells: List[List[Cell]] = [[None] * width for _ in range(height)]
+        self._positions: List[List[Position]] = [[None] * width for _ in range(height)]
+
+    @property
+    def map(self) -> List[List[Cell]]:
+        for y in range(self.height):
+            for x in range(self.width):
+                self.get_cell(x, y)
+        return self._cells
 
     def get_cell_by_pos(self, pos) -> Cell:
-        return self.map[pos.y][pos.x]
+        return self.get_cell(pos.x, pos.y)
 
     def get_cell(self, x, y) -> Cell:
-        return self.map[y][x]
+        row = self._cells[y]
+        cell = row[x]
+        if cell is None:
+            # negative indices wrap around like the list of lists this replaced
+            cell = row[x] = Cell(x % self.width, y % self.height, self)
+        return cell
+
+    def position(self, x, y) -> 'Position':
+        """
+        the shared Position for (x, y), positions off the map are not interned
+        """
+        if 0 <= x < self.width and 0 <= y < self.height:
+            pos = self._positions[y][x]
+            if pos is None:
+                pos = self._positions[y][x] = Position(x, y, self)
+            return pos
+        return Position(x, y)
+
+    def resource_mask(self, r_type: str = None):
+        """
+        boolean [y, x] grid of the cells holding resources, optionally of one type only
+        """
+        if r_type is None:
+            return (self.resource_type != 0) & (self.resource_amount > 0)
+        return (self.resource_type == RESOURCE_CODES[r_type]) & (self.resource_amount > 0)
+
+    def citytile_mask(self, team):
+        """
+        boolean [y, x] grid of the city tiles owned by team
+        """
+        return self.citytile_team == team
 
     def _setResource(self, r_type, x, y, amount):
         """
         do not use this function, this is for internal tracking of state
         """
-        cell = self.get_cell(x, y)
-        cell.resource = Resource(r_type, amount)
+        self.resource_type[y, x] = RESOURCE_CODES[r_type] if r_type is not None else 0
+        self.resource_amount[y, x] = amount
+
+    def _setResources(self, r_types, xs, ys, amounts):
+        """
+        do not use this function, this is for internal tracking of state
+        """
+        self.resource_type[ys, xs] = [RESOURCE_CODES[r_type] for r_type in r_types]
+        self.resource_amount[ys, xs] = amounts
 
 
 class Position:
-    def __init__(self, x, y):
+    """
+    treat as immutable, positions handed out by a GameMap are shared
+    """
+    __slots__ = ("x", "y", "_map")
+
+    def __init__(self, x, y, game_map: GameMap = None):
         self.x = x
         self.y = y
+        self._map = game_map
 
     def __sub__(self, pos) -> int:
         return abs(pos.x - self.x) + abs(pos.y - self.y)
@@ -67,20 +208,28 @@ class Position:
     def __eq__(self, pos) -> bool:
         return self.x == pos.x and self.y == pos.y
 
+    def __hash__(self) -> int:
+        return hash((self.x, self.y))
+
     def equals(self, pos):
         return self == pos
 
+    def _at(self, x, y) -> 'Position':
+        if self._map is not None:
+            return self._map.position(x, y)
+        return Position(x, y)
+
     def translate(self, direction, units) -> 'Position':
         if direction == DIRECTIONS.NORTH:
-            return Position(self.x, self.y - units)
+            return self._at(self.x, self.y - units)
         elif direction == DIRECTIONS.EAST:
-            return Position(self.x + units, self.y)
+            return self._at(self.x + units, self.y)
         elif direction == DIRECTIONS.SOUTH:
-            return Position(self.x, self.y + units)
+            return self._at(self.x, self.y + units)
         elif direction == DIRECTIONS.WEST:
-            return Position(self.x - units, self.y)
+            return self._at(self.x - units, self.y)
         elif direction == DIRECTIONS.CENTER:
-            return Position(self.x, self.y)
+            return self._at(self.x, self.y)
 
     def direction_to(self, target_pos: 'Position') -> DIRECTIONS:
         """
@@ -1,4 +1,6 @@
-from typing import Dict
+from typing import Dict, List
+
+import numpy as np
 
 from .constants import Constants
 from .game_map import Position
@@ -6,14 +8,59 @@ from .game_constants import GAME_CONSTANTS
 
 UNIT_TYPES = Constants.UNIT_TYPES
 
+UNIT_DTYPE = np.dtype([
+    ("id", "U16"),
+    ("team", np.int8),
+    ("type", np.int8),
+    ("x", np.int16),
+    ("y", np.int16),
+    ("cooldown", np.float64),
+    ("wood", np.int32),
+    ("coal", np.int32),
+    ("uranium", np.int32),
+])
+
 
 class Player:
     def __init__(self, team):
         self.team = team
         self.research_points = 0
-        self.units: list[Unit] = []
+        self.unit_table = np.zeros(0, dtype=UNIT_DTYPE)
+        self._units: List[Unit] = []
+        self._map = None
         self.cities: Dict[str, City] = {}
         self.city_tile_count = 0
+
+    @property
+    def units(self) -> List['Unit']:
+        """
+        Unit views onto unit_table, created on first access each turn
+        """
+        if self._units is None:
+            self._units = [Unit._view(self.unit_table, i, self._map) for i in range(len(self.unit_table))]
+        return self._units
+
+    @units.setter
+    def units(self, units: List['Unit']):
+        table = np.array([unit._record() for unit in units], dtype=UNIT_DTYPE)
+        for i, unit in enumerate(units):
+            unit._bind(table, i, unit._map)
+        self._set_unit_table(table, list(units), self._map)
+
+    def _set_unit_table(self, table, units=None, game_map=None):
+        """
+        do not use this function, this is for internal tracking of state
+        """
+        self.unit_table = table
+        self._units = units
+        self._map = game_map
+
+    def can_act_mask(self):
+        """
+        boolean mask over unit_table of the units whose cooldown allows them to act
+        """
+        return self.unit_table["cooldown"] < 1
+
     def researched_coal(self) -> bool:
         return self.research_points >= GAME_CONSTANTS["PARAMETERS"]["RESEARCH_REQUIREMENTS"]["COAL"]
     def researched_uranium(self) -> bool:
@@ -27,8 +74,8 @@ class City:
         self.fuel = fuel
         self.citytiles: list[CityTile] = []
         self.light_upkeep = light_upkeep
-    def _add_city_tile(self, x, y, cooldown):
-        ct = CityTile(self.team, self.cityid, x, y, cooldown)
+    def _add_city_tile(self, x, y, cooldown, game_map=None):
+        ct = CityTile(self.team, self.cityid, x, y, cooldown, game_map)
         self.citytiles.append(ct)
         return ct
     def get_light_upkeep(self):
@@ -36,10 +83,13 @@ class City:
 
 
 class CityTile:
-    def __init__(self, teamid, cityid, x, y, cooldown):
+    def __init__(self, teamid, cityid, x, y, cooldown, game_map=None):
+        """
+        game_map: where pos is interned, if any
+        """
         self.cityid = cityid
         self.team = teamid
-        self.pos = Position(x, y)
+        self.pos = game_map.position(x, y) if game_map is not None else Position(x, y)
         self.cooldown = cooldown
     def can_act(self) -> bool:
         """
@@ -64,26 +114,100 @@ class CityTile:
 
 
 class Cargo:
-    def __init__(self):
-        self.wood = 0
-        self.coal = 0
-        self.uranium = 0
+    """
+    view onto the cargo columns of a Unit's row
+    """
+    def __init__(self, unit: 'Unit'):
+        self._unit = unit
+
+    @property
+    def wood(self) -> int:
+        return int(self._unit._table["wood"][self._unit._row])
+
+    @wood.setter
+    def wood(self, wood: int):
+        self._unit._table["wood"][self._unit._row] = wood
+
+    @property
+    def coal(self) -> int:
+        return int(self._unit._table["coal"][self._unit._row])
+
+    @coal.setter
+    def coal(self, coal: int):
+        self._unit._table["coal"][self._unit._row] = coal
+
+    @property
+    def uranium(self) -> int:
+        return int(self._unit._table["uranium"][self._unit._row])
+
+    @uranium.setter
+    def uranium(self, uranium: int):
+        self._unit._table["uranium"][self._unit._row] = uranium
 
     def __str__(self) -> str:
         return f"Cargo | Wood: {self.wood}, Coal: {self.coal}, Uranium: {self.uranium}"
 
 
 class Unit:
+    """
+    view onto one row of a Player's unit_table
+    """
     def __init__(self, teamid, u_type, unitid, x, y, cooldown, wood, coal, uranium):
-        self.pos = Position(x, y)
-        self.team = teamid
-        self.id = unitid
-        self.type = u_type
-        self.cooldown = cooldown
-        self.cargo = Cargo()
-        self.cargo.wood = wood
-        self.cargo.coal = coal
-        self.cargo.uranium = uranium
+        table = np.array([(unitid, teamid, u_type, x, y, cooldown, wood, coal, uranium)], dtype=UNIT_DTYPE)
+        self._bind(table, 0)
+        self.cargo = Cargo(self)
+
+    @classmethod
+    def _view(cls, table, row, game_map=None) -> 'Unit':
+        unit = cls.__new__(cls)
+        unit._bind(table, row, game_map)
+        unit.cargo = Cargo(unit)
+        return unit
+
+    def _bind(self, table, row, game_map=None):
+        """
+        do not use this function, this is for internal tracking of state
+        game_map: where pos is interned, if any
+        """
+        self._table = table
+        self._row = row
+        self._map = game_map
+
+    def _record(self):
+        return self._table[self._row]
+
+    @property
+    def id(self) -> str:
+        return str(self._table["id"][self._row])
+
+    @property
+    def team(self) -> int:
+        return int(self._table["team"][self._row])
+
+    @property
+    def type(self) -> int:
+        return int(self._table["type"][self._row])
+
+    @property
+    def pos(self) -> Position:
+        x, y = int(self._table["x"][self._row]), int(self._table["y"][self._row])
+        if self._map is not None:
+            return self._map.position(x, y)
+        return Position(x, y)
+
+    @pos.setter
+    def pos(self, pos: Position):
+        self._table["x"][self._row] = pos.x
+        self._table["y"][self._row] = pos.y
+
+    @property
+    def cooldown(self) -> float:
+        return float(self._table["cooldown"][self._row])
+
+    @cooldown.setter
+    def cooldown(self, cooldown: float):
+        self._table["cooldown"][self._row] = cooldown
+
     def is_worker(self) -> bool:
         return self.type == UNIT_TYPES.WORKER
 
@@ -0,0 +1,109 @@
+import numpy as np
+
+RESOURCE_TYPES = ['wood', 'coal', 'uranium']
+
+UNIT_DTYPE = np.dtype([
+  ('id', np.int32),
+  ('team', np.int8),
+  ('x', np.int8),
+  ('y', np.int8),
+  ('cooldown', np.float32),
+  ('cargo', np.int16),
+])
+
+CITY_DTYPE = np.dtype([
+  ('id', np.int32),
+  ('team', np.int8),
+  ('fuel', np.float32),
+  ('light_upkeep', np.float32),
+])
+
+CITYTILE_DTYPE = np.dtype([
+  ('city', np.int32),
+  ('team', np.int8),
+  ('x', np.int8),
+  ('y', np.int8),
+])
+
+RESOURCE_DTYPE = np.dtype([
+  ('type', np.int8),
+  ('x', np.int8),
+  ('y', np.int8),
+  ('amount', np.int16),
+])
+
+
+class IdTable:
+  """
+  Interns unit and city id strings as small ints. One table is shared by all
+  observations of an episode, so each id string is stored once.
+  """
+  def __init__(self):
+    self.index = {}
+    self.names = []
+
+  def intern(self, name):
+    i = self.index.get(name)
+    if i is None:
+      i = self.index[name] = len(self.names)
+      self.names.append(name)
+    return i
+
+  def __getstate__(self):
+    return self.names
+
+  def __setstate__(self, names):
+    self.names = names
+    self.index = {name: i for i, name in enumerate(names)}
+
+
+class PackedObservation:
+  """
+  One observation's updates as record arrays, in place of the update strings.
+  Unit cargo is the total of all three resources, all the encoder reads.
+  """
+  __slots__ = ('step', 'player', 'width', 'height', 'ids', 'units', 'cities', 'citytiles', 'resources', 'research')
+
+  def __init__(self, obs, ids=None):
+    self.step = obs['step']
+    self.player = obs.get('player')
+    self.width, self.height = obs['width'], obs['height']
+    self.ids = ids = IdTable() if ids is None else ids
+    self.research = np.zeros(2, dtype=np.int16)
+
+    units, cities, citytiles, resources = [], [], [], []
+    city_rows = {}
+    for update in obs['updates']:
+      strs = update.split(' ')
+      input_identifier = strs[0]
+
+      if input_identifier == 'u':
+        units.append((
+          ids.intern(strs[3]), int(strs[2]), int(strs[4]), int(strs[5]), float(strs[6]),
+          int(strs[7]) + int(strs[8]) + int(strs[9])
+        ))
+      elif input_identifier == 'ct':
+        citytiles.append((city_rows[strs[2]], int(strs[1]), int(strs[3]), int(strs[4])))
+      elif input_identifier == 'r':
+        resources.append((RESOURCE_TYPES.index(strs[1]), int(strs[2]), int(strs[3]), int(float(strs[4]))))
+      elif input_identifier == 'rp':
+        self.research[int(strs[1])] = min(int(strs[2]), 200)
+      elif input_identifier == 'c':
+        city_rows[strs[2]] = len(cities)
+        cities.append((ids.intern(strs[2]), int(strs[1]), float(strs[3]), float(strs[4])))
+
+    self.units = np.array(units, dtype=UNIT_DTYPE)
+    self.cities = np.array(cities, dtype=CITY_DTYPE)
+    self.citytiles = np.array(citytiles, dtype=CITYTILE_DTYPE)
+    self.resources = np.array(resources, dtype=RESOURCE_DTYPE)
+
+  def __getstate__(self):
+    return tuple(getattr(self, name) for name in self.__slots__)
+
+  def __setstate__(self, state):
+    for name, value in zip(self.__slots__, state):
+      setattr(self, name, value)
+
+  def unit_names(self):
+    return [self.ids.names[i] for i in self.units['id']]
+
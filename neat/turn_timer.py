@@ -0,0 +1,90 @@
+import atexit
+import csv
+import json
+import time
+import numpy as np
+
+PHASES = ['parse', 'encode', 'inference', 'decode']
+
+
+class _Phase:
+  def __init__(self, timer, name):
+    self.timer = timer
+    self.name = name
+
+  def __enter__(self):
+    self.start = time.perf_counter()
+
+  def __exit__(self, *exc):
+    row = self.timer.current
+    row[self.name] = row.get(self.name, 0.0) + (time.perf_counter() - self.start) * 1000
+
+
+class _Off:
+  def __enter__(self):
+    pass
+
+  def __exit__(self, *exc):
+    pass
+
+
+_off = _Off()
+
+
+class TurnTimer:
+  """
+  Opt-in per-phase turn timings. Pass a .json or .csv path to enable; with no
+  path every phase()/turn() is a no-op context manager.
+
+  Times are in ms. JSON output has the per-turn rows and a summary
+  (count/mean/p50/p95/max) per phase, CSV output has the summary only. The
+  file is written by dump(), which also runs at interpreter exit.
+  """
+  def __init__(self, path=None):
+    self.path = path
+    self.enabled = bool(path)
+    self.turns = []
+    self.current = None
+    if self.enabled:
+      atexit.register(self.dump)
+
+  def turn(self, step):
+    if not self.enabled:
+      return _off
+    self.current = {'step': step}
+    self.turns.append(self.current)
+    return _Phase(self, 'turn')
+
+  def phase(self, name):
+    if not self.enabled or self.current is None:
+      return _off
+    return _Phase(self, name)
+
+  def summary(self):
+    stats = {}
+    for phase in PHASES + ['turn']:
+      ms = np.array([row[phase] for row in self.turns if phase in row])
+      if len(ms) == 0:
+        continue
+      stats[phase] = {
+        'count': len(ms),
+        'mean': float(ms.mean()),
+        'p50': float(np.percentile(ms, 50)),
+        'p95': float(np.percentile(ms, 95)),
+        'max': float(ms.max()),
+      }
+    return stats
+
+  def dump(self):
+    if not self.enabled or not self.turns:
+      return
+    stats = self.summary()
+    if self.path.endswith('.csv'):
+      with open(self.path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['phase', 'count', 'mean_ms', 'p50_ms', 'p95_ms', 'max_ms'])
+        for phase, s in stats.items():
+          writer.writerow([phase, s['count'], s['mean'], s['p50'], s['p95'], s['max']])
+    else:
+      with open(self.path, 'w') as f:
+        json.dump({'summary': stats, 'turns': self.turns}, f, indent=2)